@@ -0,0 +1,530 @@
+import argparse
+import json
+import math
+import os
+import struct
+import sys
+import tempfile
+
+import numpy as np
+
+from dsp import SAMPLE_FORMATS, as_frames, to_float
+from take_index import TAKE_PATTERN
+from wavfile import layout_data_size, layout_format, read_layout
+
+try:
+    import soundfile
+except ImportError:  # Only needed to analyse FLAC takes after the fact
+    soundfile = None
+
+# Samples per min/max pair at each overview resolution, finest first
+OVERVIEW_LEVELS = (512, 4096, 32768)
+# Loudness and silence are measured in 100 ms steps; gating blocks are four
+# of them (400 ms, 75% overlap) as BS.1770 specifies
+STEP_SECONDS = 0.1
+GATE_STEPS = 4
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+# Gating blocks are kept as a histogram of their loudness (block count and
+# summed power per bin) rather than one value per block, so a take of any
+# length gates in fixed memory. Bins are 0.01 LU; louder than the ceiling
+# lands in the top bin.
+LOUDNESS_BIN_LU = 0.01
+LOUDNESS_CEILING_LUFS = 10.0
+# Finest bins and steps are gathered per block and folded into the spool,
+# coarser levels and totals this many at a time (about 20 s of audio), so
+# the folding costs little per block and memory is still bounded
+FOLD_BINS = 2048
+FOLD_STEPS = 256
+# A 100 ms step quieter than this (RMS) counts as silence
+SILENCE_DBFS = -60.0
+# Samples at or beyond this are counted as clipped
+CLIP_LEVEL = 0.9999
+# True peak by 4x oversampling through a 48-tap interpolator, as in
+# BS.1770 Annex 2. Inter-sample peaks stay well within 6 dB of the sample
+# peak, so blocks that can't beat the running true peak are skipped.
+OVERSAMPLING = 4
+TRUE_PEAK_TAPS = 48
+TRUE_PEAK_HEADROOM = 2.0
+
+SIDECAR_EXTENSION = '.peaks'
+SIDECAR_MAGIC = b'TKAN'
+SIDECAR_VERSION = 1
+# magic, version, level count, sample rate, frames, clipped samples, sample
+# peak, true peak, integrated loudness (NaN when gated out), silent
+# fraction, first and last sound in seconds (NaN for a silent track)
+SIDECAR_HEADER = struct.Struct('<4sHHIQQffffff')
+SIDECAR_LEVEL = struct.Struct('<II')  # Samples per bin, bins
+
+
+def k_weighting(sample_rate):
+    # The two BS.1770 pre-filter biquads (high shelf, then the RLB high-pass)
+    # for any sample rate, as (b, a) pairs
+    k = math.tan(math.pi * 1681.974450955533 / sample_rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = (((vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0),
+             (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0))
+    k = math.tan(math.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    high_pass = ((1.0, -2.0, 1.0), (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0))
+    return shelf, high_pass
+
+
+def k_weighted_power(sample_rate, step):
+    # |H|^2 of the K-weighting at the rfft bins of one step, folded with the
+    # one-sided spectrum factors and 1/N^2, so a step's K-weighted mean
+    # square is |rfft(x)|^2 @ weights. Filtering in the frequency domain
+    # keeps this to one FFT per step; the step edges differ from a running
+    # IIR filter by far less than the meter's resolution.
+    z = np.exp(-2j * np.pi * np.fft.rfftfreq(step))
+    response = np.ones(len(z))
+    for b, a in k_weighting(sample_rate):
+        response *= np.abs(np.polyval(b[::-1], z) / np.polyval(a[::-1], z)) ** 2
+    fold = np.full(len(z), 2.0)
+    fold[0] = 1.0
+    if step % 2 == 0:
+        fold[-1] = 1.0
+    return response * fold / (step * step)
+
+
+def interpolator():
+    # 48-tap windowed-sinc low-pass at the original Nyquist, split into its
+    # four phases as a (12, 4) matrix ordered for a sliding window of input
+    n = np.arange(TRUE_PEAK_TAPS) - (TRUE_PEAK_TAPS - 1) / 2
+    taps = np.sinc(n / OVERSAMPLING) * np.kaiser(TRUE_PEAK_TAPS, 8.0)
+    phases = taps.reshape(-1, OVERSAMPLING)
+    phases /= phases.sum(axis=0)  # Unity gain at DC for every phase
+    return phases[::-1].astype(np.float32)
+
+
+def to_pairs(minima, maxima):
+    # Float minima and maxima as the int16 pairs overviews are kept in
+    pairs = np.empty((len(minima), 2), dtype='<i2')
+    pairs[:, 0] = np.clip(np.rint(minima * 32767), -32767, 32767)
+    pairs[:, 1] = np.clip(np.rint(maxima * 32767), -32767, 32767)
+    return pairs
+
+
+def fold_pairs(pairs, group):
+    # Every `group` pairs into one; a short last group folds what it has
+    bins = -(-len(pairs) // group)
+    folded = np.empty((bins, 2), dtype='<i2')
+    whole = len(pairs) // group
+    grouped = pairs[:whole * group].reshape(whole, group, 2)
+    folded[:whole, 0] = grouped[:, :, 0].min(axis=1)
+    folded[:whole, 1] = grouped[:, :, 1].max(axis=1)
+    if bins > whole:
+        folded[whole, 0] = pairs[whole * group:, 0].min()
+        folded[whole, 1] = pairs[whole * group:, 1].max()
+    return folded
+
+
+class PairBuffer:
+    # int16 min/max pairs appended a few at a time into one array that
+    # doubles as it fills, rather than one small array per block
+
+    def __init__(self):
+        self.pairs = np.empty((256, 2), dtype='<i2')
+        self.count = 0
+
+    def append(self, pairs):
+        end = self.count + len(pairs)
+        if end > len(self.pairs):
+            grown = np.empty((max(end, 2 * len(self.pairs)), 2), dtype='<i2')
+            grown[:self.count] = self.pairs[:self.count]
+            self.pairs = grown
+        self.pairs[self.count:end] = pairs
+        self.count = end
+
+    def view(self):
+        return self.pairs[:self.count]
+
+
+class TrackAnalyzer:
+    # Everything a viewer or QC step wants from one mono track, computed as
+    # the samples stream past: min/max overviews at several resolutions,
+    # sample and true peak, clipped samples, BS.1770 integrated loudness and
+    # silence in 100 ms steps. process() takes float samples in -1..1 in any
+    # block size; partial bins and steps carry over to the next block.
+    # Memory stays flat however long the take: the finest overview level is
+    # spooled to a temporary file in `spool_directory` (next to the take, not
+    # a RAM-backed /tmp), the coarser ones are held as int16 pairs, and
+    # loudness and silence are running totals.
+
+    def __init__(self, sample_rate, spool_directory=None):
+        self.sample_rate = sample_rate
+        self.step = max(int(round(sample_rate * STEP_SECONDS)), 1)
+        self.power_weights = k_weighted_power(sample_rate, self.step)
+        self.phases = interpolator()
+        self.history = np.zeros(len(self.phases) - 1, dtype=np.float32)
+        self.bin_pending = np.zeros(0, dtype=np.float32)
+        self.step_pending = np.zeros(0, dtype=np.float32)
+        self.minima = []
+        self.maxima = []
+        self.gathered_bins = 0
+        self.step_loudness = []  # K-weighted mean square per step
+        self.step_power = []  # Plain mean square per step, for silence
+        self.gathered_steps = 0
+        self.spool = tempfile.TemporaryFile(dir=spool_directory)
+        self.finest_bins = 0
+        self.coarse = [PairBuffer() for _ in OVERVIEW_LEVELS[1:]]
+        self.coarse_pending = [np.zeros((0, 2), dtype='<i2') for _ in OVERVIEW_LEVELS[1:]]
+        bins = int(round((LOUDNESS_CEILING_LUFS - ABSOLUTE_GATE_LUFS) / LOUDNESS_BIN_LU))
+        self.block_counts = np.zeros(bins, dtype=np.int64)
+        self.block_power = np.zeros(bins, dtype=np.float64)
+        self.recent_steps = np.zeros(0)  # K-weighted mean squares of the last GATE_STEPS - 1 steps
+        self.block_window = np.full(GATE_STEPS, 1.0 / GATE_STEPS)
+        self.steps = 0
+        self.sound_steps = 0
+        self.first_sound_step = None
+        self.last_sound_step = None
+        self.frames = 0
+        self.sample_peak = 0.0
+        self.true_peak = 0.0
+        self.clipped = 0
+
+    def process(self, samples):
+        samples = np.asarray(samples, dtype=np.float32)
+        if not len(samples):
+            return
+        self.frames += len(samples)
+        magnitude = np.abs(samples)
+        peak = float(magnitude.max())
+        self.sample_peak = max(self.sample_peak, peak)
+        if peak >= CLIP_LEVEL:
+            self.clipped += int(np.count_nonzero(magnitude >= CLIP_LEVEL))
+
+        extended = np.concatenate((self.history, samples))
+        if peak * TRUE_PEAK_HEADROOM > self.true_peak:
+            windows = np.lib.stride_tricks.sliding_window_view(extended, len(self.phases))
+            self.true_peak = max(self.true_peak, float(np.abs(windows @ self.phases).max()))
+        self.history = extended[-len(self.history):].copy()
+
+        bins = np.concatenate((self.bin_pending, samples))
+        count = len(bins) // OVERVIEW_LEVELS[0]
+        if count:
+            whole = bins[:count * OVERVIEW_LEVELS[0]].reshape(count, OVERVIEW_LEVELS[0])
+            self.minima.append(whole.min(axis=1))
+            self.maxima.append(whole.max(axis=1))
+            self.gathered_bins += count
+            if self.gathered_bins >= FOLD_BINS:
+                self.fold_bins()
+        self.bin_pending = bins[count * OVERVIEW_LEVELS[0]:]
+
+        steps = np.concatenate((self.step_pending, samples))
+        count = len(steps) // self.step
+        if count:
+            whole = steps[:count * self.step].reshape(count, self.step)
+            spectrum = np.fft.rfft(whole, axis=1)
+            self.step_loudness.append((spectrum.real ** 2 + spectrum.imag ** 2) @ self.power_weights)
+            self.step_power.append(np.einsum('ij,ij->i', whole, whole, dtype=np.float64) / self.step)
+            self.gathered_steps += count
+            if self.gathered_steps >= FOLD_STEPS:
+                self.fold_steps()
+        self.step_pending = steps[count * self.step:]
+
+    def fold_bins(self):
+        if self.minima:
+            self.add_pairs(to_pairs(np.concatenate(self.minima), np.concatenate(self.maxima)))
+        self.minima, self.maxima, self.gathered_bins = [], [], 0
+
+    def fold_steps(self):
+        if self.step_power:
+            self.add_steps(np.concatenate(self.step_power), np.concatenate(self.step_loudness))
+        self.step_power, self.step_loudness, self.gathered_steps = [], [], 0
+
+    def add_pairs(self, pairs):
+        # Finest level to the spool, folded into the coarser ones as their
+        # groups fill
+        self.spool.write(pairs.tobytes())
+        self.finest_bins += len(pairs)
+        for level, samples_per_bin in enumerate(OVERVIEW_LEVELS[1:]):
+            group = samples_per_bin // OVERVIEW_LEVELS[0]
+            pending = np.concatenate((self.coarse_pending[level], pairs))
+            whole = len(pending) // group * group
+            if whole:
+                self.coarse[level].append(fold_pairs(pending[:whole], group))
+            self.coarse_pending[level] = pending[whole:]
+
+    def add_steps(self, power, loudness=None):
+        sound = np.flatnonzero(power > 10 ** (SILENCE_DBFS / 10))
+        if len(sound):
+            if self.first_sound_step is None:
+                self.first_sound_step = self.steps + int(sound[0])
+            self.last_sound_step = self.steps + int(sound[-1])
+            self.sound_steps += len(sound)
+        self.steps += len(power)
+        if loudness is None:
+            return
+        recent = np.concatenate((self.recent_steps, loudness))
+        if len(recent) >= GATE_STEPS:
+            blocks = np.convolve(recent, self.block_window, 'valid')
+            with np.errstate(divide='ignore'):
+                block_loudness = -0.691 + 10 * np.log10(blocks)
+            gated = block_loudness > ABSOLUTE_GATE_LUFS
+            index = ((block_loudness[gated] - ABSOLUTE_GATE_LUFS) / LOUDNESS_BIN_LU).astype(np.int64)
+            index = np.minimum(index, len(self.block_counts) - 1)
+            np.add.at(self.block_counts, index, 1)
+            np.add.at(self.block_power, index, blocks[gated])
+        self.recent_steps = recent[-(GATE_STEPS - 1):]
+
+    def overviews(self):
+        # After finish(): the finest level is mapped from the spool, so
+        # writing it out never loads it whole
+        self.spool.flush()
+        if self.finest_bins:
+            finest = np.memmap(self.spool, dtype='<i2', mode='r', shape=(self.finest_bins, 2))
+        else:
+            finest = np.zeros((0, 2), dtype='<i2')
+        levels = [(OVERVIEW_LEVELS[0], finest)]
+        for samples_per_bin, pairs in zip(OVERVIEW_LEVELS[1:], self.coarse):
+            levels.append((samples_per_bin, pairs.view()))
+        return levels
+
+    def loudness(self):
+        count = self.block_counts.sum()
+        if not count:
+            return None
+        relative_gate = -0.691 + 10 * math.log10(self.block_power.sum() / count) + RELATIVE_GATE_LU
+        # Blocks are known to their bin, so the relative gate is applied to
+        # within 0.01 LU
+        first = min(max(int(round((relative_gate - ABSOLUTE_GATE_LUFS) / LOUDNESS_BIN_LU)), 0),
+                    len(self.block_counts) - 1)
+        return -0.691 + 10 * math.log10(self.block_power[first:].sum() / self.block_counts[first:].sum())
+
+    def finish(self):
+        self.fold_bins()
+        self.fold_steps()
+        if len(self.bin_pending):
+            self.add_pairs(to_pairs(self.bin_pending.min(keepdims=True), self.bin_pending.max(keepdims=True)))
+        for level, pending in enumerate(self.coarse_pending):
+            if len(pending):
+                self.coarse[level].append(fold_pairs(pending, len(pending)))
+        self.coarse_pending = [pending[:0] for pending in self.coarse_pending]
+        if len(self.step_pending):
+            self.add_steps(np.array([np.mean(self.step_pending.astype(np.float64) ** 2)]))
+        loudness = self.loudness()
+        sound = self.first_sound_step is not None
+        result = {
+            'sample_rate': self.sample_rate,
+            'frames': self.frames,
+            'clipped_samples': self.clipped,
+            'sample_peak': self.sample_peak,
+            'true_peak': max(self.true_peak, self.sample_peak),
+            'loudness': loudness if loudness is not None else math.nan,
+            'silent_fraction': 1.0 - self.sound_steps / self.steps if self.steps else 1.0,
+            'first_sound': float(self.first_sound_step * STEP_SECONDS) if sound else math.nan,
+            'last_sound': float(min((self.last_sound_step + 1) * STEP_SECONDS, self.frames / self.sample_rate))
+            if sound else math.nan,
+            'overviews': self.overviews(),
+        }
+        self.spool.close()  # The mapping outlives the (already unlinked) file
+        return result
+
+
+def sidecar_path(audio_path):
+    # {name}_{take}_{track}.peaks beside the track, whatever its encoding
+    return os.path.splitext(audio_path)[0] + SIDECAR_EXTENSION
+
+
+def write_sidecar(path, result):
+    levels = result['overviews']
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(SIDECAR_HEADER.pack(SIDECAR_MAGIC, SIDECAR_VERSION, len(levels), result['sample_rate'],
+                                    result['frames'], result['clipped_samples'], result['sample_peak'],
+                                    result['true_peak'], result['loudness'], result['silent_fraction'],
+                                    result['first_sound'], result['last_sound']))
+        for samples_per_bin, pairs in levels:
+            f.write(SIDECAR_LEVEL.pack(samples_per_bin, len(pairs)))
+        for samples_per_bin, pairs in levels:
+            f.write(memoryview(np.ascontiguousarray(pairs)).cast('B'))
+    os.replace(temp_path, path)
+
+
+def read_sidecar(path, overviews=True):
+    # The analysis dict written by write_sidecar, or None if the file isn't
+    # a sidecar this version understands
+    with open(path, 'rb') as f:
+        header = f.read(SIDECAR_HEADER.size)
+        if len(header) < SIDECAR_HEADER.size:
+            return None
+        (magic, version, level_count, sample_rate, frames, clipped, sample_peak, true_peak, loudness,
+         silent_fraction, first_sound, last_sound) = SIDECAR_HEADER.unpack(header)
+        if magic != SIDECAR_MAGIC or version != SIDECAR_VERSION:
+            return None
+        table = [SIDECAR_LEVEL.unpack(f.read(SIDECAR_LEVEL.size)) for _ in range(level_count)]
+        levels = []
+        if overviews:
+            for samples_per_bin, bins in table:
+                pairs = np.frombuffer(f.read(bins * 4), dtype='<i2').reshape(-1, 2)
+                levels.append((samples_per_bin, pairs))
+    return {
+        'sample_rate': sample_rate,
+        'frames': frames,
+        'clipped_samples': clipped,
+        'sample_peak': sample_peak,
+        'true_peak': true_peak,
+        'loudness': loudness,
+        'silent_fraction': silent_fraction,
+        'first_sound': first_sound,
+        'last_sound': last_sound,
+        'overviews': levels,
+    }
+
+
+def summary(result):
+    # The headline figures as plain JSON values; levels in dB, None where
+    # there is nothing to measure
+    def decibels(value):
+        return round(20 * math.log10(value), 2) if value > 0 else None
+
+    def finite(value, digits=3):
+        return round(value, digits) if not math.isnan(value) else None
+
+    return {
+        'seconds': round(result['frames'] / result['sample_rate'], 3) if result['sample_rate'] else 0.0,
+        'peak_dbfs': decibels(result['sample_peak']),
+        'true_peak_dbtp': decibels(result['true_peak']),
+        'loudness_lufs': finite(result['loudness'], 2),
+        'clipped_samples': result['clipped_samples'],
+        'silent': result['silent_fraction'] >= 1.0,
+        'silent_fraction': round(result['silent_fraction'], 4),
+        'first_sound': finite(result['first_sound']),
+        'last_sound': finite(result['last_sound']),
+    }
+
+
+def read_wav_blocks(path, block_frames=1 << 18):
+    # Float blocks of a mono take WAV, read straight from its data chunk
+    with open(path, 'rb') as f:
+        layout = read_layout(f)
+        if layout is None or layout['data'] is None:
+            raise ValueError(f"{path} is not a WAV file")
+        if layout['channels'] != 1:
+            raise ValueError(f"{path} has {layout['channels']} channels; takes are mono")
+        fmt = layout_format(layout, SAMPLE_FORMATS.values())
+        if fmt is None:
+            raise ValueError(f"{path}: unsupported sample format")
+        data_size = min(layout_data_size(layout), f.seek(0, os.SEEK_END) - layout['data'])
+        yield layout['sample_rate']
+        f.seek(layout['data'])
+        remaining = data_size - data_size % fmt.width
+        while remaining > 0:
+            data = f.read(min(remaining, block_frames * fmt.width))
+            if not data:
+                break
+            remaining -= len(data)
+            yield to_float(as_frames(data, 1, fmt), fmt)[:, 0]
+
+
+def read_flac_blocks(path, block_frames=1 << 18):
+    if soundfile is None:
+        raise RuntimeError("Analysing FLAC takes needs the soundfile package")
+    with soundfile.SoundFile(path) as f:
+        if f.channels != 1:
+            raise ValueError(f"{path} has {f.channels} channels; takes are mono")
+        yield f.samplerate
+        for block in f.blocks(blocksize=block_frames, dtype='float32'):
+            yield block
+
+
+def analyse_file(path):
+    # Decode pass for a track recorded without analysis or by another tool;
+    # writes its sidecar and returns the analysis
+    blocks = read_flac_blocks(path) if path.lower().endswith('.flac') else read_wav_blocks(path)
+    analyzer = TrackAnalyzer(next(blocks), os.path.dirname(os.path.abspath(path)))
+    for block in blocks:
+        analyzer.process(block)
+    result = analyzer.finish()
+    write_sidecar(sidecar_path(path), result)
+    return result
+
+
+def is_current(path):
+    # A sidecar at least as new as its track covers it (FLAC encodes touch
+    # the sidecar of the WAV they replace)
+    try:
+        return os.stat(sidecar_path(path)).st_mtime_ns >= os.stat(path).st_mtime_ns
+    except OSError:
+        return False
+
+
+def load_analysis(path, overviews=True):
+    # The track's sidecar, analysing the track first if it's missing or stale
+    if is_current(path):
+        result = read_sidecar(sidecar_path(path), overviews)
+        if result is not None:
+            return result
+    return analyse_file(path)
+
+
+def take_files(directory, name=None, take=None):
+    # {(name, take, track): path} for the take files in a directory. Where a
+    # track exists as both WAV and FLAC (mid-encode) the WAV wins.
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            match = TAKE_PATTERN.match(entry.name)
+            if not match or not entry.is_file():
+                continue
+            track = os.path.splitext(entry.name)[0].rsplit('_', 1)[1]
+            if not track.isdigit():
+                continue  # A raw interleaved take; its tracks are analysed as they're split
+            key = (match.group(1), int(match.group(2)), int(track))
+            if (name is not None and key[0] != name) or (take is not None and key[1] != take):
+                continue
+            if key not in files or entry.name.lower().endswith('.wav'):
+                files[key] = entry.path
+    return files
+
+
+def analyse_take(directory, name, take):
+    # {track: summary} for one take, from sidecars where they're current
+    return {key[2]: summary(load_analysis(path, overviews=False))
+            for key, path in sorted(take_files(directory, name, take).items())}
+
+
+def analyse_directory(directory, force=False):
+    # Bring every take's sidecars in a folder up to date. Only tracks
+    # without a current sidecar are decoded, so running this after each
+    # session costs one pass over the new material. Returns
+    # {filename: summary} for the tracks analysed.
+    analysed = {}
+    for key, path in sorted(take_files(directory).items()):
+        if not force and is_current(path):
+            continue
+        try:
+            analysed[os.path.basename(path)] = summary(analyse_file(path))
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"Cannot analyse {os.path.basename(path)}: {e}")
+    return analysed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write analysis sidecars for take files that don't have current ones.")
+    parser.add_argument('directory', nargs='?', help="Directory to scan (defaults to save_directory in config.json)")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--force', action='store_true', help="Re-analyse tracks with current sidecars too")
+    args = parser.parse_args()
+
+    directory = args.directory
+    if directory is None and os.path.exists(args.config):
+        with open(args.config, 'r') as f:
+            directory = json.load(f).get('save_directory')
+    if not directory or not os.path.isdir(directory):
+        parser.error("no valid directory to scan")
+
+    analysed = analyse_directory(directory, args.force)
+    for name, figures in sorted(analysed.items()):
+        print(f"{name}: {json.dumps(figures)}")
+    print(f"{len(analysed)} track(s) analysed in {directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import threading
+import time
+
+import numpy as np
+
+# PortAudio values, so fake streams and PyAudio streams look the same to
+# CaptureEngine without it having to import pyaudio.
+PA_FLOAT32 = 0x1
+PA_INT24 = 0x4
+PA_INT16 = 0x8
+PA_CONTINUE = 0
+PA_INPUT_UNDERFLOW = 0x1
+PA_INPUT_OVERFLOW = 0x2
+
+BACKENDS = ('pyaudio', 'fake')
+
+
+def open_backend(name='pyaudio', **options):
+    # A backend is anything with PyAudio's device and stream API:
+    # get_device_count(), get_device_info_by_index(), open() and terminate().
+    if name == 'pyaudio':
+        import pyaudio
+        return pyaudio.PyAudio()
+    if name == 'fake':
+        return FakeBackend(**options)
+    raise ValueError(f"Unknown audio backend: {name}")
+
+
+class FakeBackend:
+    # Simulated input devices producing deterministic multichannel test
+    # signals in real time (or `speed` times faster), with optional timing
+    # jitter. Used to exercise and benchmark the recorder without hardware.
+    # With several devices, each runs `drift_ppm` further off nominal than
+    # the one before, like independent interface clocks. `probe_ms` makes
+    # every device info query that slow, as on hosts with many ALSA and
+    # virtual devices.
+
+    def __init__(self, channels=8, sample_rate=48000, jitter_ms=0.0, speed=1.0, seed=0, devices=None,
+                 device_count=1, drift_ppm=0.0, probe_ms=0.0):
+        if devices is None:
+            devices = []
+            for i in range(device_count):
+                name = f"Fake {channels}ch {sample_rate} Hz" + (f" #{i + 1}" if device_count > 1 else "")
+                devices.append({'name': name, 'channels': channels, 'sample_rate': sample_rate,
+                                'drift_ppm': i * drift_ppm})
+        self.devices = devices
+        self.jitter_ms = jitter_ms
+        self.speed = speed
+        self.seed = seed
+        self.probe_ms = probe_ms
+        self.streams = []
+
+    def get_device_count(self):
+        return len(self.devices)
+
+    def get_device_info_by_index(self, index):
+        if self.probe_ms:
+            time.sleep(self.probe_ms / 1000.0)
+        device = self.devices[index]
+        return {
+            'index': index,
+            'name': device['name'],
+            'hostApi': 0,
+            'maxInputChannels': device['channels'],
+            'maxOutputChannels': 0,
+            'defaultSampleRate': float(device['sample_rate']),
+            'defaultLowInputLatency': 0.01,
+            'defaultHighInputLatency': 0.1,
+        }
+
+    def open(self, rate, channels, format=PA_INT16, input=True, input_device_index=0,
+             frames_per_buffer=1024, stream_callback=None, **kwargs):
+        if channels > self.devices[input_device_index]['channels']:
+            raise OSError("Invalid number of channels")
+        stream = FakeStream(self, input_device_index, rate, channels, frames_per_buffer, stream_callback, format)
+        self.streams.append(stream)
+        return stream
+
+    def terminate(self):
+        for stream in self.streams:
+            stream.close()
+        self.streams = []
+
+
+class FakeStream:
+    # One second of per-channel sines at integer frequencies is rendered up
+    # front, so producing a buffer is only a slice of that loop. Buffers are
+    # delivered on an ideal schedule plus jitter; if the callback falls more
+    # than a buffer behind, the missed buffers are dropped and the next one
+    # is flagged as an input overflow, as a real device would.
+
+    def __init__(self, backend, device_index, rate, channels, frames_per_buffer, callback, format=PA_INT16):
+        self.backend = backend
+        self.device_index = device_index
+        self.rate = rate
+        self.channels = channels
+        self.frames_per_buffer = frames_per_buffer
+        self.callback = callback
+        self.format = format
+        self.rng = np.random.default_rng(backend.seed + device_index)
+        self.loop = self.render_loop()
+        self.frame = 0
+        self.active = False
+        self.thread = None
+        self.delivered = 0
+        self.dropped = 0
+
+    def render_loop(self):
+        t = np.arange(self.rate, dtype=np.float64) / self.rate
+        frequencies = 110.0 * (np.arange(self.channels) + 1)
+        amplitudes = np.linspace(0.9, 0.05, self.channels) * 32767
+        loop = np.sin(2 * np.pi * t[:, None] * frequencies[None, :]) * amplitudes[None, :]
+        # Repeat the head so a buffer never has to wrap
+        loop = np.concatenate([loop, loop[:self.frames_per_buffer]])
+        if self.format == PA_FLOAT32:
+            return (loop / 32768.0).astype('<f4')
+        if self.format == PA_INT24:
+            # Low three bytes of each little-endian int32, packed per frame
+            wide = (loop * 256.0).astype('<i4')
+            return wide.view(np.uint8).reshape(len(loop), self.channels, 4)[:, :, :3].reshape(len(loop), -1).copy()
+        return loop.astype('<i2')
+
+    def read_buffer(self):
+        start = self.frame % self.rate
+        data = self.loop[start:start + self.frames_per_buffer].tobytes()
+        self.frame += self.frames_per_buffer
+        return data
+
+    def start_stream(self):
+        self.active = True
+        self.thread = threading.Thread(target=self.run, name="FakeStream")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        drift = self.backend.devices[self.device_index].get('drift_ppm', 0.0) * 1e-6
+        period = self.frames_per_buffer / (self.rate * (1.0 + drift)) / self.backend.speed
+        jitter = self.backend.jitter_ms / 1000.0
+        started = time.perf_counter()
+        buffer_index = 0
+        status = 0
+        while self.active:
+            due = started + (buffer_index + 1) * period
+            if jitter:
+                due += abs(self.rng.normal(0.0, jitter))
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            behind = int((time.perf_counter() - started) / period) - buffer_index - 1
+            if behind > 0:
+                # The consumer stalled past a whole buffer; those are lost
+                self.frame += behind * self.frames_per_buffer
+                buffer_index += behind
+                self.dropped += behind
+                status |= PA_INPUT_OVERFLOW
+            now = time.perf_counter()
+            time_info = {'input_buffer_adc_time': now - period, 'current_time': now, 'output_buffer_dac_time': 0.0}
+            self.callback(self.read_buffer(), self.frames_per_buffer, time_info, status)
+            self.delivered += 1
+            buffer_index += 1
+            status = 0
+
+    def stop_stream(self):
+        self.active = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def close(self):
+        self.stop_stream()
+
+    def is_active(self):
+        return self.active
@@ -0,0 +1,74 @@
+import os
+import struct
+import sys
+import time
+from array import array
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dsp import deinterleave, track_bytes  # noqa: E402
+
+SAMPLE_RATE = 48000
+SECONDS = 2
+BUFFER_FRAMES = 1024
+
+
+def make_buffers(channels):
+    # Deterministic interleaved int16 buffers, one per 1024-frame read
+    rng = np.random.default_rng(channels)
+    total = SAMPLE_RATE * SECONDS
+    samples = rng.integers(-32768, 32767, size=(total, channels), dtype='<i2')
+    return [samples[i:i + BUFFER_FRAMES].tobytes() for i in range(0, total, BUFFER_FRAMES)]
+
+
+def legacy_extract(frames, channels):
+    # The original per-sample struct loop from AudioRecorderGUI
+    channel_data = [[] for _ in range(channels)]
+    for frame in frames:
+        samples = struct.unpack('<' + ('h' * (len(frame) // 2)), frame)
+        for i in range(0, len(samples), channels):
+            for ch in range(channels):
+                if i + ch < len(samples):
+                    sample = samples[i + ch]
+                    channel_data[ch].append(struct.pack('<h', sample))
+    return [b''.join(data) for data in channel_data]
+
+
+def array_extract(frames, channels):
+    # Per-buffer array slicing, as the streaming writer first shipped
+    out = [[] for _ in range(channels)]
+    for frame in frames:
+        samples = array('h', frame)
+        for ch in range(channels):
+            out[ch].append(samples[ch::channels].tobytes())
+    return [b''.join(data) for data in out]
+
+
+def numpy_extract(frames, channels):
+    views = deinterleave(b''.join(frames), channels, range(channels))
+    return [bytes(track_bytes(views[ch])) for ch in range(channels)]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    print(f"De-interleave {SECONDS}s @ {SAMPLE_RATE} Hz, int16, all channels")
+    print(f"{'channels':>8} {'struct (s)':>11} {'array (s)':>10} {'numpy (s)':>10} {'vs struct':>10} {'vs array':>9}")
+    for channels in (2, 8, 32):
+        frames = make_buffers(channels)
+        t_legacy, legacy = timed(legacy_extract, frames, channels)
+        t_array, arr = timed(array_extract, frames, channels)
+        t_numpy, vec = timed(numpy_extract, frames, channels)
+        assert legacy == arr == vec
+        print(f"{channels:>8} {t_legacy:>11.3f} {t_array:>10.4f} {t_numpy:>10.4f} "
+              f"{t_legacy / t_numpy:>9.0f}x {t_array / t_numpy:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from bench_deinterleave import legacy_extract  # noqa: E402
+from bench_suite import peak_rss_mb  # noqa: E402
+from dsp import SAMPLE_FORMATS, deinterleave, track_bytes  # noqa: E402
+from raw_take import RawTake, track_path  # noqa: E402
+from wavfile import TakeFile  # noqa: E402
+
+SAMPLE_RATE = 48000
+WRITE_FRAMES = 65536
+# The struct loop is far too slow for gigabytes; it is timed on a slice and
+# its rate reported
+LEGACY_BYTES = 4 * 1024 * 1024
+
+
+def make_raw_take(path, gigabytes, channels, fmt):
+    # Noise at a steady level, one write per block like the raw take writer
+    rng = np.random.default_rng(0)
+    block = rng.integers(-2 ** 20, 2 ** 20, size=(WRITE_FRAMES, channels), dtype='<i4')
+    if fmt.name == 'int16':
+        data = (block >> 8).astype('<i2').tobytes()
+    elif fmt.name == 'int24':
+        data = block.view(np.uint8).reshape(WRITE_FRAMES, channels, 4)[..., :3].tobytes()
+    else:
+        data = (block / 2 ** 23).astype('<f4').tobytes()
+    take_file = TakeFile(path, channels, SAMPLE_RATE, fmt.width, format_tag=fmt.format_tag, sync=False)
+    target = int(gigabytes * 1024 ** 3)
+    while take_file.data_size < target:
+        take_file.write(data)
+    take_file.close()
+    return take_file.data_size
+
+
+def split_mmap(path, tracks, directory):
+    with RawTake(path) as raw:
+        raw.export(tracks, {track: track_path(directory, 'Bench', 1, track) for track in tracks}, analyse=False)
+
+
+def split_memory(path, tracks, directory):
+    # The whole take in memory, then one strided view per track: what
+    # splitting looks like when the take is held as captured
+    with RawTake(path) as raw:
+        fmt, channels, offset, size = raw.sample_format, raw.channels, raw.data_offset, raw.frames * raw.frame_bytes
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(size)
+    views = deinterleave(data, channels, tracks, fmt)
+    for track in tracks:
+        take_file = TakeFile(track_path(directory, 'Bench', 1, track), 1, SAMPLE_RATE, fmt.width,
+                             format_tag=fmt.format_tag)
+        take_file.write(track_bytes(views[track]))
+        take_file.close()
+
+
+def split_legacy(path, tracks, directory):
+    # The original per-sample extract_channel_data() on the first few MB
+    with RawTake(path) as raw:
+        channels, offset, frame_bytes = raw.channels, raw.data_offset, raw.frame_bytes
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(LEGACY_BYTES - LEGACY_BYTES % frame_bytes)
+    legacy_extract([data], channels)
+    return len(data)
+
+
+def run_child(mode, path, tracks, directory):
+    start = time.perf_counter()
+    measured = os.path.getsize(path)
+    if mode == 'mmap':
+        split_mmap(path, tracks, directory)
+    elif mode == 'memory':
+        split_memory(path, tracks, directory)
+    else:
+        measured = split_legacy(path, tracks, directory)
+    elapsed = time.perf_counter() - start
+    return {
+        'mode': mode,
+        'seconds': elapsed,
+        'mb_s': measured / (1024 * 1024) / elapsed if elapsed else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split tracks from a raw interleaved take: memory map vs in memory.")
+    parser.add_argument('--gigabytes', type=float, default=2.0, help="Size of the raw take")
+    parser.add_argument('--channels', type=int, default=32)
+    parser.add_argument('--format', choices=tuple(SAMPLE_FORMATS), default='int24')
+    parser.add_argument('--tracks', type=int, default=8, help="How many tracks to split out")
+    parser.add_argument('--modes', nargs='*', choices=('mmap', 'memory', 'legacy'), default=('mmap', 'memory', 'legacy'))
+    parser.add_argument('--directory', help="Where to write the take (default: a temporary folder)")
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    tracks = list(range(min(args.tracks, args.channels)))
+    if args.child:
+        mode, path = args.child
+        print(json.dumps(run_child(mode, path, tracks, os.path.dirname(path))))
+        return
+
+    fmt = SAMPLE_FORMATS[args.format]
+    directory = tempfile.mkdtemp(prefix='recorder_split_', dir=args.directory)
+    try:
+        path = os.path.join(directory, 'Bench_0001_raw.wav')
+        start = time.perf_counter()
+        size = make_raw_take(path, args.gigabytes, args.channels, fmt)
+        print(f"Raw take: {size / 1024 ** 3:.2f} GB, {args.channels} ch {fmt.name}, "
+              f"written in {time.perf_counter() - start:.1f} s; splitting {len(tracks)} track(s)")
+        if 'legacy' in args.modes and fmt.name != 'int16':
+            print("legacy mode needs --format int16; skipped")
+        print(f"{'mode':>7} {'seconds':>8} {'MB/s':>8} {'peak RSS MB':>12}")
+        for mode in args.modes:
+            if mode == 'legacy' and fmt.name != 'int16':
+                continue
+            # Each mode in a fresh process, so peak RSS is its own
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, path,
+                                    '--tracks', str(args.tracks), '--channels', str(args.channels)],
+                                   capture_output=True, text=True)
+            lines = [line for line in child.stdout.splitlines() if line.startswith('{')]
+            if child.returncode or not lines:
+                print(f"{mode:>7} failed: {child.stderr.strip().splitlines()[-1:]}")
+                continue
+            result = json.loads(lines[-1])
+            # Legacy only ran on a slice; its rate is the comparable figure
+            seconds = f"{result['seconds']:.2f}" if mode != 'legacy' else '-'
+            rss = f"{result['peak_rss_mb']:.0f}" if mode != 'legacy' and result['peak_rss_mb'] is not None else '-'
+            print(f"{mode:>7} {seconds:>8} {result['mb_s']:>8.1f} {rss:>12}")
+            for name in os.listdir(directory):
+                if not name.endswith('_raw.wav'):
+                    os.remove(os.path.join(directory, name))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG = 'bench_startup_config.json'
+
+# Runs inside a fresh interpreter so import and start-up costs are real.
+# The device catalogue cached in the config is kept between runs of the
+# same backend unless --cold removes it first.
+CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+mode, seconds, osc_port, backend_name, backend_options = (sys.argv[1], float(sys.argv[2]), int(sys.argv[3]),
+                                                          sys.argv[4], json.loads(sys.argv[5]))
+from recorder_engine import RecorderEngine
+if mode == 'gui':
+    import tkinter as tk
+    from Audiorecorder import AudioRecorderGUI
+imported = time.perf_counter()
+engine = RecorderEngine(config_file=sys.argv[6], osc_ip='127.0.0.1', osc_port=osc_port,
+                        backend_name=backend_name, backend_options=backend_options)
+if mode == 'gui':
+    root = tk.Tk()
+    app = AudioRecorderGUI(root, engine)
+    root.update()
+else:
+    engine.start()
+ready = time.perf_counter()
+print('ready', flush=True)
+engine.wait_for_devices()
+devices = time.perf_counter()
+switches = []
+for _ in range(3):
+    switch_start = time.perf_counter()
+    engine.select_devices(engine.device_names)
+    switches.append(time.perf_counter() - switch_start)
+cpu_start = time.process_time()
+idle_start = time.perf_counter()
+if mode == 'gui':
+    root.after(int(seconds * 1000), root.quit)
+    root.mainloop()
+else:
+    time.sleep(seconds)
+idle_cpu = (time.process_time() - cpu_start) / (time.perf_counter() - idle_start) * 100
+engine.close(save_config=True)
+print(json.dumps({'import_s': imported - start, 'ready_s': ready - start, 'devices_s': devices - start,
+                  'switch_s': min(switches), 'idle_cpu_percent': idle_cpu, 'timings': engine.timings}), flush=True)
+"""
+
+
+def run(mode, seconds, osc_port, backend_name, backend_options, cold):
+    config = os.path.join(ROOT, CONFIG)
+    if cold and os.path.exists(config):
+        os.remove(config)
+    launched = time.perf_counter()
+    child = subprocess.Popen([sys.executable, '-c', CHILD, mode, str(seconds), str(osc_port),
+                              backend_name, json.dumps(backend_options), config],
+                             cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    ready_wall = None
+    result = None
+    for line in child.stdout:
+        if line.strip() == 'ready' and ready_wall is None:
+            ready_wall = time.perf_counter() - launched
+        elif line.startswith('{'):
+            result = json.loads(line)
+    child.wait()
+    if result is None:
+        return None, child.stderr.read().strip().splitlines()[-1:]
+    result['launch_to_ready_s'] = ready_wall
+    return result, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare start-up time, device open and switch time and idle CPU "
+                                                 "of headless and GUI modes, with and without a cached device catalogue.")
+    parser.add_argument('--seconds', type=float, default=10.0, help="Idle time to sample CPU over")
+    parser.add_argument('--osc-port', type=int, default=45650)
+    parser.add_argument('--backend', choices=('pyaudio', 'fake'), default='pyaudio')
+    parser.add_argument('--fake-devices', type=int, default=32, help="Devices the fake backend lists")
+    parser.add_argument('--fake-probe-ms', type=float, default=50.0, help="Time each fake device info query takes")
+    parser.add_argument('--modes', nargs='*', choices=('headless', 'gui'), default=('headless', 'gui'))
+    args = parser.parse_args()
+
+    backend_options = {}
+    if args.backend == 'fake':
+        backend_options = {'device_count': args.fake_devices, 'probe_ms': args.fake_probe_ms}
+
+    print(f"{'mode':>8} {'catalogue':>9} {'launch->ready (s)':>18} {'imports (s)':>12} {'init (s)':>9} "
+          f"{'stream (s)':>11} {'devices (s)':>12} {'switch (s)':>11} {'idle CPU %':>11}")
+    offset = 0
+    for mode in args.modes:
+        for cold in (True, False):
+            result, error = run(mode, args.seconds, args.osc_port + offset, args.backend, backend_options, cold)
+            offset += 1
+            catalogue = 'cold' if cold else 'cached'
+            if result is None:
+                print(f"{mode:>8} {catalogue:>9} failed: {' '.join(error)}")
+                continue
+            # First stream open, straight from the cache when it is warm
+            timings = result['timings']
+            stream_s = timings.get('first_stream_ms', timings.get('devices_ready_ms', 0.0)) / 1000
+            print(f"{mode:>8} {catalogue:>9} {result['launch_to_ready_s']:>18.3f} {result['import_s']:>12.3f} "
+                  f"{result['ready_s'] - result['import_s']:>9.3f} {stream_s:>11.3f} {result['devices_s']:>12.3f} "
+                  f"{result['switch_s']:>11.3f} {result['idle_cpu_percent']:>11.2f}")
+    config = os.path.join(ROOT, CONFIG)
+    if os.path.exists(config):
+        os.remove(config)
+
+
+if __name__ == "__main__":
+    main()
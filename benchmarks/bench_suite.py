@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import TrackAnalyzer  # noqa: E402
+from backends import FakeBackend  # noqa: E402
+from dsp import SAMPLE_FORMATS, deinterleave, to_float, track_bytes  # noqa: E402
+from meters import LevelMeter  # noqa: E402
+from recorder_engine import RecorderEngine  # noqa: E402
+from wavfile import TakeFile  # noqa: E402
+
+CHANNELS = (2, 16, 64)
+SAMPLE_RATES = (48000, 96000)
+SAMPLE_FORMAT_NAMES = ('int16', 'int24')
+BUFFER_FRAMES = 1024
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def bench_components(channels, rate, fmt, directory):
+    # Per-stage costs on one second of the fake device's signal
+    backend = FakeBackend(channels, rate)
+    stream = backend.open(rate, channels, format=fmt.pa_format, frames_per_buffer=BUFFER_FRAMES, stream_callback=None)
+    buffers = [stream.read_buffer() for _ in range(rate // BUFFER_FRAMES)]
+    data = b''.join(buffers)
+    megabytes = len(data) / (1024 * 1024)
+
+    start = time.perf_counter()
+    views = deinterleave(data, channels, range(channels), fmt)
+    tracks = [track_bytes(views[ch]) for ch in range(channels)]
+    deinterleave_s = time.perf_counter() - start
+
+    meter = LevelMeter(channels, rate, sample_format=fmt)
+    start = time.perf_counter()
+    for buffer in buffers:
+        meter.process(buffer)
+    meter_us = (time.perf_counter() - start) / len(buffers) * 1e6
+
+    start = time.perf_counter()
+    for ch, samples in enumerate(tracks):
+        take_file = TakeFile(os.path.join(directory, f"component_{ch + 1}.wav"), 1, rate, fmt.width,
+                             format_tag=fmt.format_tag, sync=False)
+        take_file.write(samples)
+        take_file.close()
+    write_s = time.perf_counter() - start
+
+    analyzers = [TrackAnalyzer(rate) for _ in range(channels)]
+    start = time.perf_counter()
+    for ch, analyzer in enumerate(analyzers):
+        analyzer.process(to_float(views[ch], fmt))
+        analyzer.finish()
+    analyse_s = time.perf_counter() - start
+
+    return {
+        'deinterleave_mb_s': megabytes / deinterleave_s if deinterleave_s else None,
+        'meter_us_per_buffer': meter_us,
+        'write_mb_s': megabytes / write_s if write_s else None,
+        # Seconds of all-track audio analysed per second, on one thread
+        'analysis_x_rt': len(buffers) * BUFFER_FRAMES / rate / analyse_s if analyse_s else None,
+    }
+
+
+def run_config(channels, rate, format_name, seconds, speed, jitter_ms):
+    fmt = SAMPLE_FORMATS[format_name]
+    directory = tempfile.mkdtemp(prefix='recorder_bench_')
+    try:
+        components = bench_components(channels, rate, fmt, directory)
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+
+        backend = FakeBackend(channels, rate, jitter_ms=jitter_ms, speed=speed)
+        engine = RecorderEngine(config_file=os.path.join(directory, 'config.json'), osc=False, backend=backend)
+        engine.save_directory = directory
+        engine.custom_name = 'Bench'
+        engine.sample_format = format_name
+        engine.start()
+        engine.wait_for_devices()
+        time.sleep(0.2)
+
+        started = time.perf_counter()
+        engine.start_recording()
+        time.sleep(seconds / speed)
+        stopped = time.perf_counter()
+        engine.stop_recording()
+        engine.wait_for_take()
+        ready = time.perf_counter()
+
+        report = engine.last_take_report or {}
+        stream_drops = sum(stream.dropped for stream in backend.streams)
+        engine.close(save_config=False)
+        written = sum(os.path.getsize(os.path.join(directory, name))
+                      for name in os.listdir(directory) if name.endswith('.wav'))
+        audio_seconds = report.get('frames', 0) / rate
+        result = {
+            'channels': channels,
+            'sample_rate': rate,
+            'sample_format': format_name,
+            'audio_seconds': audio_seconds,
+            'throughput_mb_s': written / (1024 * 1024) / (ready - started),
+            # Width-independent: seconds of audio per second of wall clock
+            # from trigger to finished files
+            'realtime_factor': audio_seconds / (ready - started),
+            'peak_rss_mb': peak_rss_mb(),
+            'dropped_buffers': stream_drops + report.get('dropped_buffers', 0),
+            'overflows': report.get('input_overflows', 0),
+            'ring_overruns': report.get('ring_overruns', 0),
+            'stop_to_file_ms': (ready - stopped) * 1000,
+        }
+        result.update(components)
+        return result
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark capture, de-interleave, meter and write paths on a fake device.")
+    parser.add_argument('--seconds', type=float, default=5.0, help="Audio seconds per take")
+    parser.add_argument('--speed', type=float, default=1.0, help="Run the fake device this many times faster than real time")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Callback timing jitter of the fake device")
+    parser.add_argument('--channels', type=int, nargs='*', default=CHANNELS)
+    parser.add_argument('--rates', type=int, nargs='*', default=SAMPLE_RATES)
+    parser.add_argument('--formats', nargs='*', choices=tuple(SAMPLE_FORMATS), default=SAMPLE_FORMAT_NAMES,
+                        help="Sample formats to compare")
+    parser.add_argument('--json', action='store_true', help="Print one JSON object per configuration")
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        channels, rate, format_name = args.child
+        print(json.dumps(run_config(int(channels), int(rate), format_name, args.seconds, args.speed, args.jitter_ms)))
+        return
+
+    if not args.json:
+        print(f"{args.seconds:g} s takes, speed {args.speed:g}x, jitter {args.jitter_ms:g} ms")
+        print(f"{'ch':>3} {'rate':>6} {'format':>7} {'MB/s':>7} {'x RT':>6} {'RSS MB':>7} {'drops':>6} "
+              f"{'stop ms':>8} {'deint MB/s':>11} {'meter us':>9} {'write MB/s':>11} {'analyse xRT':>12}")
+    for rate in args.rates:
+        for channels in args.channels:
+            for format_name in args.formats:
+                # A fresh process per configuration keeps peak RSS meaningful
+                child = subprocess.run([sys.executable, os.path.abspath(__file__),
+                                        '--child', str(channels), str(rate), format_name,
+                                        '--seconds', str(args.seconds), '--speed', str(args.speed),
+                                        '--jitter-ms', str(args.jitter_ms)],
+                                       capture_output=True, text=True)
+                lines = [line for line in child.stdout.splitlines() if line.startswith('{')]
+                if child.returncode or not lines:
+                    print(f"{channels:>3} {rate:>6} {format_name:>7} failed: {child.stderr.strip().splitlines()[-1:]}")
+                    continue
+                result = json.loads(lines[-1])
+                if args.json:
+                    print(json.dumps(result))
+                    continue
+                rss = f"{result['peak_rss_mb']:.0f}" if result['peak_rss_mb'] is not None else '-'
+                print(f"{channels:>3} {rate:>6} {format_name:>7} {result['throughput_mb_s']:>7.2f} "
+                      f"{result['realtime_factor']:>6.2f} {rss:>7} "
+                      f"{result['dropped_buffers'] + result['ring_overruns']:>6} {result['stop_to_file_ms']:>8.1f} "
+                      f"{result['deinterleave_mb_s']:>11.0f} {result['meter_us_per_buffer']:>9.0f} "
+                      f"{result['write_mb_s']:>11.0f} {result['analysis_x_rt']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
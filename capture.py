@@ -0,0 +1,355 @@
+import math
+import time
+from collections import deque
+
+from backends import PA_CONTINUE, PA_INPUT_OVERFLOW, PA_INPUT_UNDERFLOW
+from dsp import INT16
+
+
+class RingBuffer:
+    # Preallocated circular buffer of interleaved frames with one producer
+    # (the PortAudio callback) and any number of independent readers.
+    # The producer copies its data in and only then publishes the new
+    # write position, so no lock is needed between the two sides; readers
+    # detect that they have been lapped by comparing positions.
+
+    def __init__(self, capacity_frames, frame_bytes, poll_interval=0.005):
+        self.capacity_frames = capacity_frames
+        self.frame_bytes = frame_bytes
+        self.poll_interval = poll_interval
+        self.buffer = bytearray(capacity_frames * frame_bytes)
+        self.view = memoryview(self.buffer)
+        self.write_frame = 0  # Total frames ever written
+
+    def write(self, data):
+        frames = len(data) // self.frame_bytes
+        if frames > self.capacity_frames:
+            # Only the newest capacity_frames can ever be read back
+            skipped = frames - self.capacity_frames
+            data = memoryview(data)[skipped * self.frame_bytes:]
+            self.write_frame += skipped
+            frames = self.capacity_frames
+        nbytes = frames * self.frame_bytes
+        start = (self.write_frame % self.capacity_frames) * self.frame_bytes
+        first = min(nbytes, len(self.buffer) - start)
+        self.view[start:start + first] = data[:first]
+        if first < nbytes:
+            self.view[:nbytes - first] = data[first:nbytes]
+        self.write_frame += frames
+
+    def copy_out(self, frame, frames):
+        nbytes = frames * self.frame_bytes
+        start = (frame % self.capacity_frames) * self.frame_bytes
+        first = min(nbytes, len(self.buffer) - start)
+        if first == nbytes:
+            return bytes(self.view[start:start + nbytes])
+        return bytes(self.view[start:]) + bytes(self.view[:nbytes - first])
+
+    def reader(self, start_frame=None):
+        return RingReader(self, start_frame)
+
+
+class RingReader:
+    # A consumer cursor into a RingBuffer. Each reader moves at its own pace;
+    # if it falls more than the ring's capacity behind, the missed frames are
+    # counted as an overrun and the reader skips to the oldest valid frame.
+
+    def __init__(self, ring, start_frame=None):
+        self.ring = ring
+        self.read_frame = ring.write_frame if start_frame is None else start_frame
+        self.overruns = 0
+        self.lost_frames = 0
+
+    def available(self):
+        return self.ring.write_frame - self.read_frame
+
+    def skip_lapped(self):
+        behind = self.ring.write_frame - self.read_frame
+        if behind > self.ring.capacity_frames:
+            lost = behind - self.ring.capacity_frames
+            self.overruns += 1
+            self.lost_frames += lost
+            self.read_frame += lost
+
+    def read(self, max_frames=None, timeout=None):
+        # Return the next block of available frames as bytes, waiting up to
+        # `timeout` seconds for data. Returns b'' if nothing arrived.
+        ring = self.ring
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.skip_lapped()
+            frames = max(self.available(), 0)
+            if max_frames is not None:
+                frames = min(frames, max_frames)
+            if frames > 0:
+                data = ring.copy_out(self.read_frame, frames)
+                if ring.write_frame - self.read_frame <= ring.capacity_frames:
+                    self.read_frame += frames
+                    return data
+                # The producer lapped us while copying; the copy is suspect
+                continue
+            if deadline is None or time.monotonic() >= deadline:
+                return b''
+            time.sleep(ring.poll_interval)
+
+
+class SampleClock:
+    # Running least-squares fit of frame position against capture time,
+    # forgetting exponentially over `horizon` seconds. Fed once per callback
+    # with a few float operations, it gives the device's actual sample rate
+    # and maps times to fractional frame positions and back, with callback
+    # scheduling jitter averaged out of both.
+
+    def __init__(self, nominal_rate, horizon=30.0):
+        self.nominal_rate = nominal_rate
+        self.horizon = horizon
+        self.origin = None  # (time, frame) of the first update keeps sums small
+        self.last_time = None
+        self.weight = 0.0
+        self.sum_t = 0.0
+        self.sum_f = 0.0
+        self.sum_tt = 0.0
+        self.sum_tf = 0.0
+        self.updates = 0
+        self.latency_total = 0.0
+
+    def update(self, frame, when, latency=0.0):
+        if self.origin is None:
+            self.origin = (when, frame)
+        t = when - self.origin[0]
+        f = frame - self.origin[1]
+        if self.last_time is not None:
+            decay = math.exp(-(when - self.last_time) / self.horizon)
+            self.weight *= decay
+            self.sum_t *= decay
+            self.sum_f *= decay
+            self.sum_tt *= decay
+            self.sum_tf *= decay
+        self.last_time = when
+        self.weight += 1.0
+        self.sum_t += t
+        self.sum_f += f
+        self.sum_tt += t * t
+        self.sum_tf += t * f
+        self.updates += 1
+        self.latency_total += latency
+
+    def rate(self):
+        if self.updates < 8:
+            return float(self.nominal_rate)
+        mean_t = self.sum_t / self.weight
+        variance = self.sum_tt / self.weight - mean_t * mean_t
+        if variance <= 1e-9:
+            return float(self.nominal_rate)
+        return (self.sum_tf / self.weight - mean_t * self.sum_f / self.weight) / variance
+
+    def frame_at(self, when):
+        # Fractional frame captured at perf_counter time `when`
+        if self.origin is None:
+            return 0.0
+        mean_t = self.sum_t / self.weight
+        mean_f = self.sum_f / self.weight
+        return self.origin[1] + mean_f + (when - self.origin[0] - mean_t) * self.rate()
+
+    def time_of(self, frame):
+        if self.origin is None:
+            return time.perf_counter()
+        mean_t = self.sum_t / self.weight
+        mean_f = self.sum_f / self.weight
+        return self.origin[0] + mean_t + (frame - self.origin[1] - mean_f) / self.rate()
+
+    def latency(self):
+        # Mean time from the ADC to the callback, where the host reports it
+        return self.latency_total / self.updates if self.updates else 0.0
+
+
+class CaptureEngine:
+    # Opens the input device in callback mode on any PyAudio-style backend. The callback does
+    # nothing but copy into the ring buffer and tally status flags, so GIL
+    # stalls elsewhere show up as counted overflows instead of silent gaps.
+    # The ring is sized for the pre-roll on top of the consumer headroom, so
+    # the last pre_roll_seconds of input are always there to start a take.
+
+    def __init__(self, audio_interface, device_index, channels, sample_rate,
+                 frames_per_buffer=1024, ring_seconds=4.0, sample_format=INT16, pre_roll_seconds=0.0,
+                 metrics=None):
+        self.audio_interface = audio_interface
+        self.device_index = device_index
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.frames_per_buffer = frames_per_buffer
+        self.sample_format = sample_format
+        self.sample_width = sample_format.width
+        self.frame_bytes = channels * self.sample_width
+        self.pre_roll_frames = int(pre_roll_seconds * sample_rate)
+        capacity = max(int(ring_seconds * sample_rate) + self.pre_roll_frames, frames_per_buffer * 2)
+        poll_interval = frames_per_buffer / sample_rate / 2
+        self.ring = RingBuffer(capacity, self.frame_bytes, poll_interval)
+        self.stream = None
+        self.callbacks = 0
+        self.input_overflows = 0
+        self.input_underflows = 0
+        # (frames written so far, perf_counter) per callback, used to map a
+        # trigger time onto a frame position and to time first delivery
+        self.history = deque(maxlen=max(int(capacity / frames_per_buffer), 2))
+        self.metrics = metrics
+        self.last_callback_time = None
+        self.clock = SampleClock(sample_rate)
+
+    def start(self):
+        self.stream = self.audio_interface.open(format=self.sample_format.pa_format,
+                                                channels=self.channels,
+                                                rate=self.sample_rate,
+                                                input=True,
+                                                input_device_index=self.device_index,
+                                                frames_per_buffer=self.frames_per_buffer,
+                                                stream_callback=self.callback)
+        self.stream.start_stream()
+
+    def callback(self, in_data, frame_count, time_info, status_flags):
+        if status_flags:
+            if status_flags & PA_INPUT_OVERFLOW:
+                self.input_overflows += 1
+            if status_flags & PA_INPUT_UNDERFLOW:
+                self.input_underflows += 1
+        first_frame = self.ring.write_frame
+        if in_data is not None:
+            self.ring.write(in_data)
+        now = time.perf_counter()
+        self.history.append((self.ring.write_frame, now))
+        # The host's stream timestamps say how long ago the first frame
+        # reached the ADC; without them the callback time has to do
+        adc_time = time_info.get('input_buffer_adc_time', 0.0) if time_info else 0.0
+        current_time = time_info.get('current_time', 0.0) if time_info else 0.0
+        latency = current_time - adc_time if adc_time > 0 and current_time >= adc_time else 0.0
+        self.clock.update(first_frame, now - latency, latency)
+        if self.metrics is not None and self.last_callback_time is not None:
+            # Deviation of the callback interval from the buffer period
+            expected = frame_count / self.sample_rate
+            self.metrics.callback_jitter_ms.record(abs(now - self.last_callback_time - expected) * 1000)
+        self.last_callback_time = now
+        self.callbacks += 1
+        return (None, PA_CONTINUE)
+
+    def stop(self):
+        # stop_stream() returns once the last callback has finished, so the
+        # ring holds everything captured up to this point.
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+
+    def is_active(self):
+        return self.stream is not None and self.stream.is_active()
+
+    def open_reader(self):
+        return self.ring.reader()
+
+    def memory_bytes(self):
+        return len(self.ring.buffer)
+
+    def frame_at(self, when):
+        # Estimate which frame was arriving at perf_counter time `when`,
+        # interpolating from the last callback delivered before it.
+        history = list(self.history)
+        limit = self.ring.write_frame + self.frames_per_buffer
+        for frame_end, delivered in reversed(history):
+            if delivered <= when:
+                frame = frame_end + int((when - delivered) * self.sample_rate)
+                return min(frame, limit)
+            limit = frame_end
+        return self.ring.write_frame
+
+    def delivery_time(self, frame):
+        # perf_counter time of the callback that delivered `frame`, if it is
+        # still in the history
+        history = list(self.history)
+        if not history or frame < history[0][0] - self.frames_per_buffer:
+            return None
+        for frame_end, delivered in history:
+            if frame_end > frame:
+                return delivered
+        return None
+
+    def arm(self, trigger_time=None):
+        # Start a take on the live stream. The start frame is taken from the
+        # trigger time, so any delay between the trigger and this call is
+        # recovered from the ring instead of being lost, and the pre-roll is
+        # simply the reader starting further back: nothing is copied twice.
+        armed_time = time.perf_counter()
+        if trigger_time is None:
+            trigger_time = armed_time
+        oldest = max(self.ring.write_frame - self.ring.capacity_frames + self.frames_per_buffer, 0)
+        trigger_frame = max(self.frame_at(trigger_time), oldest)
+        start_frame = max(trigger_frame - self.pre_roll_frames, oldest)
+        return TakeReader(self, start_frame, trigger_frame, trigger_time, armed_time)
+
+    def counters(self):
+        return {
+            'callbacks': self.callbacks,
+            'input_overflows': self.input_overflows,
+            'input_underflows': self.input_underflows,
+        }
+
+
+class TakeReader(RingReader):
+    # The recording sink armed on a live CaptureEngine. It reads from the
+    # trigger frame up to the stop frame and remembers the engine's counters
+    # when it was armed, so gap statistics cover exactly one take.
+
+    def __init__(self, engine, start_frame, trigger_frame, trigger_time, armed_time):
+        super().__init__(engine.ring, start_frame)
+        self.engine = engine
+        self.start_frame = start_frame
+        self.trigger_frame = trigger_frame
+        self.end_frame = None
+        self.trigger_time = trigger_time
+        self.armed_time = armed_time
+        self.baseline = engine.counters()
+        self.trigger_delivery = None
+
+    def disarm(self, stop_time=None):
+        if stop_time is None:
+            stop_time = time.perf_counter()
+        # Frames already handed out can't be taken back, so the take never
+        # ends before what has been read.
+        self.end_frame = max(self.engine.frame_at(stop_time), self.trigger_frame, self.read_frame)
+
+    def read(self, max_frames=None, timeout=None):
+        if self.end_frame is not None:
+            remaining = self.end_frame - self.read_frame
+            if remaining <= 0:
+                return b''
+            max_frames = remaining if max_frames is None else min(max_frames, remaining)
+        data = super().read(max_frames, timeout)
+        if data and self.trigger_delivery is None and self.read_frame > self.trigger_frame:
+            # Look this up while the history still covers it
+            self.trigger_delivery = self.engine.delivery_time(self.trigger_frame)
+        metrics = self.engine.metrics
+        if data and metrics is not None:
+            # How long the oldest frame of this block sat in the ring
+            delivered = self.engine.delivery_time(self.read_frame - len(data) // self.ring.frame_bytes)
+            if delivered is not None:
+                metrics.read_latency_ms.record((time.perf_counter() - delivered) * 1000)
+        return data
+
+    def finished(self):
+        return self.end_frame is not None and self.read_frame >= self.end_frame
+
+    def report(self):
+        counters = self.engine.counters()
+        report = {key: counters[key] - self.baseline[key] for key in counters}
+        report['ring_overruns'] = self.overruns
+        report['lost_frames'] = self.lost_frames
+        report['start_frame'] = self.start_frame
+        report['pre_roll_frames'] = self.trigger_frame - self.start_frame
+        report['frames'] = (self.end_frame if self.end_frame is not None else self.read_frame) - self.start_frame
+        report['trigger_to_arm_ms'] = (self.armed_time - self.trigger_time) * 1000
+        delivered = self.trigger_delivery
+        if delivered is not None:
+            report['trigger_to_first_sample_ms'] = (delivered - self.trigger_time) * 1000
+        return report
+
+    def has_gaps(self):
+        report = self.report()
+        return bool(report['input_overflows'] or report['input_underflows'] or report['ring_overruns'])
@@ -0,0 +1,93 @@
+import numpy as np
+
+from backends import PA_FLOAT32, PA_INT16, PA_INT24
+from wavfile import WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM
+
+
+class SampleFormat:
+    # One capture sample format, as PortAudio delivers it and as it is
+    # stored: bytes per sample, the NumPy dtype of one stored unit (packed
+    # 24-bit samples are three uint8 units) and the WAV format tag.
+
+    def __init__(self, name, pa_format, width, dtype, format_tag, flac_subtype):
+        self.name = name
+        self.pa_format = pa_format
+        self.width = width
+        self.dtype = np.dtype(dtype)
+        self.format_tag = format_tag
+        self.flac_subtype = flac_subtype  # None where FLAC can't hold it losslessly
+
+    def __repr__(self):
+        return f"SampleFormat({self.name!r})"
+
+
+SAMPLE_FORMATS = {
+    'int16': SampleFormat('int16', PA_INT16, 2, '<i2', WAVE_FORMAT_PCM, 'PCM_16'),
+    'int24': SampleFormat('int24', PA_INT24, 3, np.uint8, WAVE_FORMAT_PCM, 'PCM_24'),
+    'float32': SampleFormat('float32', PA_FLOAT32, 4, '<f4', WAVE_FORMAT_IEEE_FLOAT, None),
+}
+
+# Interleaved 16-bit little-endian PCM, the default everywhere
+INT16 = SAMPLE_FORMATS['int16']
+
+
+def as_frames(data, channels, fmt=INT16):
+    # View a block of interleaved bytes as a (frames, channels) array, or
+    # (frames, channels, 3) bytes for packed 24-bit. No samples are copied;
+    # a trailing partial frame is ignored.
+    frames = len(data) // (channels * fmt.width)
+    units = np.frombuffer(data, dtype=fmt.dtype, count=frames * channels * fmt.width // fmt.dtype.itemsize)
+    if fmt.dtype.itemsize == fmt.width:
+        return units.reshape(frames, channels)
+    return units.reshape(frames, channels, fmt.width)
+
+
+def deinterleave(data, channels, tracks, fmt=INT16):
+    # Return one strided view per track over the same buffer. Each view
+    # steps `channels` samples at a time, so nothing is copied until the
+    # caller writes it out. Samples keep their native width throughout.
+    frames = as_frames(data, channels, fmt)
+    return {track: frames[:, track] for track in tracks}
+
+
+def unpack(frames, fmt=INT16):
+    # Sample values of an as_frames() array: int16 and float32 as they are,
+    # packed 24-bit as int32
+    if fmt.name != 'int24':
+        return frames
+    # Read every sample as an int32 starting one byte early, so its three
+    # bytes land in the top of the word with the sign; shifting out the
+    # neighbour's byte leaves the exact 24-bit value
+    shape = frames.shape[:-1]
+    packed = np.empty(frames.size + 1, dtype=np.uint8)
+    packed[1:] = frames.reshape(-1)
+    strides = tuple(3 * int(np.prod(shape[i + 1:])) for i in range(len(shape)))
+    return np.ndarray(shape, dtype='<i4', buffer=packed, strides=strides) >> 8
+
+
+def pack(samples, fmt=INT16):
+    # The inverse of unpack() for computed samples: round and clip to the
+    # format and return an array in its storage layout
+    if fmt.name == 'float32':
+        return samples.astype('<f4')
+    limit = 8388608 if fmt.name == 'int24' else 32768
+    values = np.clip(np.rint(samples), -limit, limit - 1)
+    if fmt.name == 'int16':
+        return values.astype('<i2')
+    words = values.astype('<i4')
+    return words.view(np.uint8).reshape(words.shape + (4,))[..., :3]
+
+
+def to_float(frames, fmt=INT16):
+    # Samples of an as_frames() array as float32 in -1..1 full scale
+    if fmt.name == 'float32':
+        return np.array(frames, dtype=np.float32)
+    samples = unpack(frames, fmt).astype(np.float32)
+    samples *= 1.0 / (8388608.0 if fmt.name == 'int24' else 32768.0)
+    return samples
+
+
+def track_bytes(view):
+    # Contiguous little-endian bytes for one de-interleaved track, ready for
+    # a single writeframes call.
+    return np.ascontiguousarray(view).data.cast('B')
@@ -0,0 +1,155 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+# Bucket upper bounds for millisecond timings, roughly log-spaced
+LATENCY_BOUNDS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+DEPTH_BOUNDS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class Histogram:
+    # Fixed-bucket histogram. The bucket list is allocated once, so record()
+    # is a bisect and a few integer updates with no allocation. Updates from
+    # several threads aren't locked; counts are approximate under contention.
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # Last bucket is overflow
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of samples
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(0.5),
+            'p99': self.percentile(0.99),
+            'max': self.max,
+            'bounds': list(self.bounds),
+            'counts': list(self.counts),
+        }
+
+
+class Metrics:
+    # Registry of the recorder's hot-path instruments. Everything is created
+    # up front; the capture, writer and meter paths only touch existing
+    # objects. Other components can contribute dicts through add_source().
+
+    def __init__(self):
+        self.callback_jitter_ms = Histogram(LATENCY_BOUNDS_MS)
+        self.read_latency_ms = Histogram(LATENCY_BOUNDS_MS)
+        self.writer_queue_depth = Histogram(DEPTH_BOUNDS)
+        self.meter_update_ms = Histogram(LATENCY_BOUNDS_MS)
+        self.disk_bytes = 0
+        self.disk_seconds = 0.0
+        self.capture_errors = 0
+        self.sources = {}
+        self.started = time.time()
+
+    def add_source(self, name, snapshot):
+        self.sources[name] = snapshot
+
+    def record_disk_write(self, nbytes, seconds):
+        self.disk_bytes += nbytes
+        self.disk_seconds += seconds
+
+    def snapshot(self):
+        snapshot = {
+            'time': time.time(),
+            'uptime_s': time.time() - self.started,
+            'callback_jitter_ms': self.callback_jitter_ms.snapshot(),
+            'read_latency_ms': self.read_latency_ms.snapshot(),
+            'writer_queue_depth': self.writer_queue_depth.snapshot(),
+            'meter_update_ms': self.meter_update_ms.snapshot(),
+            'disk_bytes': self.disk_bytes,
+            'disk_mb_s': self.disk_bytes / self.disk_seconds / (1024 * 1024) if self.disk_seconds else 0.0,
+            'capture_errors': self.capture_errors,
+        }
+        for name, source in list(self.sources.items()):
+            try:
+                snapshot[name] = source()
+            except Exception as e:
+                snapshot[name] = {'error': str(e)}
+        return snapshot
+
+
+def summary(snapshot):
+    # Flat, compact view of a snapshot for OSC and logs
+    flat = {}
+    for key, value in snapshot.items():
+        if isinstance(value, dict):
+            for inner, inner_value in value.items():
+                if isinstance(inner_value, (int, float)) and not isinstance(inner_value, bool):
+                    flat[f"{key}.{inner}"] = inner_value
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[key] = value
+    return flat
+
+
+class MetricsExporter:
+    # Writes a JSON snapshot every `interval` seconds (atomically, so readers
+    # never see a half-written file) and passes it to `on_snapshot`.
+
+    def __init__(self, metrics, path=None, interval=5.0, on_snapshot=None):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.on_snapshot = on_snapshot
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="MetricsExporter")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.export()
+
+    def export(self):
+        snapshot = self.metrics.snapshot()
+        if self.path:
+            try:
+                temp_path = self.path + '.tmp'
+                with open(temp_path, 'w') as f:
+                    json.dump(snapshot, f)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                print(f"Metrics export error: {e}")
+        if self.on_snapshot is not None:
+            try:
+                self.on_snapshot(snapshot)
+            except Exception as e:
+                print(f"Metrics export error: {e}")
+        return snapshot
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+            # Leave a final snapshot covering the whole session
+            self.export()
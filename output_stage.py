@@ -0,0 +1,152 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from analysis import sidecar_path
+
+try:
+    import soundfile
+except ImportError:  # FLAC output is optional
+    soundfile = None
+
+FLAC_AVAILABLE = soundfile is not None
+FLAC_SUBTYPES = ('PCM_S8', 'PCM_16', 'PCM_24')
+OUTPUT_FORMATS = ('wav', 'flac')
+
+
+class EncodeJob:
+    # One track of one take going through the encoder pool
+
+    def __init__(self, take_number, source, target, future):
+        self.take_number = take_number
+        self.source = source
+        self.target = target
+        self.future = future
+        self.result = None
+        self.error = None
+
+    def done(self):
+        return self.future.done()
+
+
+class OutputStage:
+    # Pooled output for take files. A thread pool writes and finalizes the
+    # per-track files of the running take concurrently; an optional process
+    # pool encodes finished takes to FLAC across cores in the background, so
+    # the recorder is ready for the next take while the last one encodes.
+    # Raw takes are split into tracks on a thread of their own, one take
+    # after another, for the same reason.
+
+    def __init__(self, write_threads=None, encode_processes=None):
+        if write_threads is None:
+            write_threads = min(8, (os.cpu_count() or 1) + 2)
+        self.write_pool = ThreadPoolExecutor(max_workers=write_threads, thread_name_prefix="TrackWriter")
+        self.encode_processes = encode_processes or os.cpu_count() or 1
+        self.encode_pool = None  # Started on first use; process start-up isn't free
+        self.split_pool = None
+        self.jobs = []
+        self.splits = []
+        self.lock = threading.Lock()
+
+    def encode_take(self, take_number, paths, delete_source=True):
+        if not FLAC_AVAILABLE:
+            raise RuntimeError("FLAC output needs the soundfile package")
+        if self.encode_pool is None:
+            # Spawned, not forked: a fork would copy this process's capture,
+            # writer and OSC threads' locks mid-use into every worker
+            self.encode_pool = ProcessPoolExecutor(max_workers=self.encode_processes,
+                                                   mp_context=multiprocessing.get_context('spawn'))
+        jobs = []
+        for source in paths:
+            target = os.path.splitext(source)[0] + '.flac'
+            future = self.encode_pool.submit(encode_flac, source, target, delete_source)
+            job = EncodeJob(take_number, source, target, future)
+            future.add_done_callback(lambda future, job=job: self.job_finished(job))
+            jobs.append(job)
+        with self.lock:
+            self.jobs.extend(jobs)
+        return jobs
+
+    def split_take(self, take_number, split):
+        # Run `split` (a raw take's track split and whatever follows it) in
+        # the background; returns its future
+        if self.split_pool is None:
+            self.split_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="RawSplit")
+        future = self.split_pool.submit(split)
+        future.add_done_callback(lambda future: self.split_finished(take_number, future))
+        with self.lock:
+            self.splits.append(future)
+        return future
+
+    def split_finished(self, take_number, future):
+        error = future.exception()
+        if error is not None:
+            print(f"Split error for take {take_number:04d}: {error}")
+
+    def job_finished(self, job):
+        try:
+            job.result = job.future.result()
+        except Exception as e:
+            job.error = e
+            print(f"Encode error for {job.source}: {e}")
+            return
+        result = job.result
+        rate = result['source_bytes'] / result['seconds'] / (1024 * 1024) if result['seconds'] else 0.0
+        print(f"Encoded {os.path.basename(job.target)}: {result['frames']} frames, "
+              f"{result['seconds']:.2f} s, {rate:.1f} MB/s, ratio {result['ratio']:.2f}")
+
+    def progress(self):
+        # Counts over the jobs still being tracked; finished takes are dropped
+        # once every one of their tracks is done.
+        with self.lock:
+            jobs = list(self.jobs)
+            if jobs and all(job.done() for job in jobs):
+                self.jobs = []
+            self.splits = [future for future in self.splits if not future.done()]
+            splitting = len(self.splits)
+        done = sum(1 for job in jobs if job.done())
+        failed = sum(1 for job in jobs if job.done() and job.error is not None)
+        return {'total': len(jobs), 'done': done, 'failed': failed, 'splitting': splitting}
+
+    def busy(self):
+        # A split hands its tracks to the encoders before it counts as done
+        progress = self.progress()
+        return progress['splitting'] > 0 or progress['done'] < progress['total']
+
+    def shutdown(self, wait=True):
+        # Unstarted encodes are cancelled; their WAV sources are left in place.
+        # Splits go first, as they write through the write pool.
+        if self.split_pool is not None:
+            self.split_pool.shutdown(wait=wait)
+        self.write_pool.shutdown(wait=wait)
+        if self.encode_pool is not None:
+            self.encode_pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def encode_flac(source, target, delete_source):
+    # Runs in a worker process: stream a WAV track into a FLAC file
+    start = time.perf_counter()
+    frames = 0
+    with soundfile.SoundFile(source) as src:
+        subtype = src.subtype if src.subtype in FLAC_SUBTYPES else 'PCM_24'
+        with soundfile.SoundFile(target, 'w', src.samplerate, src.channels, subtype=subtype, format='FLAC') as dst:
+            for block in src.blocks(blocksize=65536, dtype='int32'):
+                dst.write(block)
+                frames += len(block)
+    elapsed = time.perf_counter() - start
+    source_bytes = os.path.getsize(source)
+    target_bytes = os.path.getsize(target)
+    if delete_source:
+        os.remove(source)
+    sidecar = sidecar_path(source)
+    if os.path.exists(sidecar):
+        os.utime(sidecar)  # Same audio, so the analysis stays current for the FLAC
+    return {
+        'frames': frames,
+        'seconds': elapsed,
+        'source_bytes': source_bytes,
+        'bytes': target_bytes,
+        'ratio': target_bytes / source_bytes if source_bytes else 0.0,
+    }
@@ -0,0 +1,117 @@
+import mmap
+import os
+
+from analysis import TrackAnalyzer, sidecar_path, summary, write_sidecar
+from dsp import SAMPLE_FORMATS, as_frames, to_float, track_bytes
+from wavfile import TakeFile, layout_data_size, layout_format, read_layout
+
+# Frames split per pass. Every selected track is written from one stretch
+# of the mapping before moving on, so each page is read from disk once
+# and can be dropped straight after.
+SPLIT_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def raw_path(save_directory, custom_name, take_number):
+    # One interleaved file per take, next to the tracks split from it
+    return os.path.join(save_directory, f"{custom_name}_{take_number:04d}_raw.wav")
+
+
+def track_path(save_directory, custom_name, take_number, track):
+    return os.path.join(save_directory, f"{custom_name}_{take_number:04d}_{track + 1}.wav")
+
+
+class RawTake:
+    # A take recorded as the raw interleaved stream: one multichannel WAV
+    # (a TakeFile, so crash-safe and RF64 past 4 GB) memory-mapped for
+    # reading. Tracks are split out through strided views of the mapping
+    # into ordinary per-track take files, at the end of the take or at any
+    # time later, without reading the file into memory.
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            layout = read_layout(self.file)
+            if layout is None or layout['data'] is None or not layout['channels']:
+                raise ValueError(f"{path} is not a WAV file")
+            self.channels = layout['channels']
+            self.sample_rate = layout['sample_rate']
+            self.sample_format = layout_format(layout, SAMPLE_FORMATS.values())
+            if self.sample_format is None:
+                raise ValueError(f"{path}: unsupported sample format")
+            file_size = self.file.seek(0, os.SEEK_END)
+            # A take cut short by a crash may have a stale header; trust the file
+            data_size = min(layout_data_size(layout), file_size - layout['data'])
+            self.data_offset = layout['data']
+            self.frame_bytes = self.channels * self.sample_format.width
+            self.frames = data_size // self.frame_bytes
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.frames else None
+        except Exception:
+            self.file.close()
+            raise
+
+    def export(self, tracks, paths, analyse=True, pool=None, header_interval=2.0):
+        # Write each of `tracks` (zero-based) to its path in `paths` and
+        # return {track: analysis summary or None}
+        fmt = self.sample_format
+        writers = {track: TakeFile(paths[track], 1, self.sample_rate, fmt.width, format_tag=fmt.format_tag,
+                                   header_interval=header_interval)
+                   for track in tracks}
+        analyzers = {track: TrackAnalyzer(self.sample_rate, os.path.dirname(os.path.abspath(paths[track])))
+                     for track in tracks} if analyse else {}
+        chunk_frames = max(SPLIT_CHUNK_BYTES // self.frame_bytes, 1)
+
+        def write_track(item):
+            track, view = item
+            writers[track].write(track_bytes(view))
+            if analyse:
+                analyzers[track].process(to_float(view, fmt))
+
+        try:
+            for first in range(0, self.frames, chunk_frames):
+                count = min(chunk_frames, self.frames - first)
+                start = self.data_offset + first * self.frame_bytes
+                block = memoryview(self.map)[start:start + count * self.frame_bytes]
+                frames = as_frames(block, self.channels, fmt)
+                views = [(track, frames[:, track]) for track in tracks]
+                if pool is None:
+                    for item in views:
+                        write_track(item)
+                else:
+                    list(pool.map(write_track, views))
+                del frames, views
+                block.release()
+                self.drop_pages(start, count * self.frame_bytes)
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        results = {}
+        for track in tracks:
+            results[track] = None
+            if analyse:
+                result = analyzers[track].finish()
+                write_sidecar(sidecar_path(paths[track]), result)
+                results[track] = summary(result)
+        return results
+
+    def drop_pages(self, start, length):
+        # The pages just split are clean and file-backed; hand them back so
+        # splitting a take of any size never holds more than a chunk resident
+        if not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        aligned = start - start % mmap.PAGESIZE
+        self.map.madvise(mmap.MADV_DONTNEED, aligned, start + length - aligned)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
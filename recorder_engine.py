@@ -0,0 +1,1107 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from pythonosc import dispatcher
+from pythonosc import osc_server
+from pythonosc import udp_client
+
+from analysis import analyse_directory, analyse_take, load_analysis, take_files
+from backends import BACKENDS, open_backend
+from capture import CaptureEngine
+from dsp import SAMPLE_FORMATS
+from meters import LevelMeter
+from metrics import Metrics, MetricsExporter, summary
+from output_stage import OutputStage, FLAC_AVAILABLE, OUTPUT_FORMATS
+from raw_take import RawTake, raw_path, track_path
+from session import CaptureSession
+from take_index import TAKE_EXTENSIONS, TakeIndex
+from take_writer import TakeWriter
+from telemetry import TelemetryPublisher, parse_client
+
+
+# Overview pairs per /overview message (4 bytes each), well inside a datagram
+OVERVIEW_CHUNK = 8192
+# Device buffers per take read: the pre-roll and any backlog are caught up
+# in blocks this size rather than copied out (and written) in one piece
+READ_BUFFERS = 16
+
+
+class RecorderError(Exception):
+    # A request the recorder can't carry out, with a short title for dialogs
+
+    def __init__(self, title, message):
+        super().__init__(message)
+        self.title = title
+        self.message = message
+
+
+class RecorderEngine:
+    # Capture, take files, take numbering and OSC control with no GUI.
+    # Front ends (the Tk window, the CLI) drive it through plain method calls
+    # and hear back through listeners: callables taking (event, info) that
+    # may be invoked from any thread. Events are 'state', 'take_number',
+    # 'device', 'devices', 'monitoring', 'analysis' and 'error'.
+
+    def __init__(self, config_file='config.json', osc_ip="192.168.1.72", osc_port=4565, osc=True, backend=None,
+                 backend_name='pyaudio', backend_options=None):
+        created = time.perf_counter()
+        self.config_file = config_file
+        self.save_directory = ""
+        self.custom_name = "Recording"
+        self.take_number = 1
+        # Highest take per name and folder, kept beside the config file
+        self.take_index = TakeIndex(os.path.join(os.path.dirname(os.path.abspath(config_file)), 'take_index.json'))
+        self.take_index.add_listener(self.on_take_index_changed)
+        self.is_recording = False
+        self.take_writer = None
+        self.take_reader = None
+        self.stop_time = None
+        self.take_started = None
+        self.recording_thread = None
+        self.last_take_report = None
+        self.device_name = ''
+        self.device_names = []  # Session devices; the first is the clock master
+        self.device_channels = []
+        # Input devices as last enumerated: name, index, channels and rate.
+        # Cached in the config so start-up never waits on PortAudio.
+        self.device_catalogue = []
+        self.audio_devices = []
+        self.device_indices = []
+        self.device_lock = threading.RLock()
+        self.devices_ready = threading.Event()
+        self.device_thread = None
+        self.timings = {}  # Start-up and device switch times in ms
+        self.channels = 0
+        self.sample_rate = 0
+        self.track_selected = []
+        self.meter = None
+        self.meter_attack_ms = 10.0  # Meter rise time constant
+        self.meter_release_ms = 300.0  # Meter fall time constant
+        self.peak_hold_seconds = 1.5
+        self.monitoring = False
+        self.monitoring_thread = None
+        self.capture_engine = None  # One live input stream shared by meters and takes
+        self.monitor_lock = threading.Lock()
+        self.control_lock = threading.RLock()  # Serialises start/stop from GUI, CLI and OSC
+        self.pre_roll_seconds = 0.0  # Audio kept from before each trigger
+        self.output_format = 'wav'
+        self.sample_format = 'int16'  # Captured, metered and written at this width
+        self.analysis_enabled = True  # Overviews, peaks and loudness per track as takes are written
+        self.last_take_analysis = None
+        self.raw_takes = False  # Keep each take's interleaved stream so any channel can be exported later
+        self.header_interval = 2.0  # Seconds between WAV header refreshes: the most a crash can cost
+        self.output_stage = OutputStage()
+        self.osc_enabled = osc
+        self.osc_ip = osc_ip
+        self.osc_port = osc_port
+        self.server = None
+        self.osc_server_thread = None
+        self.osc_client = None
+        self.listeners = []
+        self.metrics = Metrics()
+        self.metrics_file = ''  # Periodic JSON snapshot; empty to disable
+        self.metrics_interval = 5.0
+        self.metrics_exporter = None
+        # Live meters and take progress for remote operators, as one OSC
+        # bundle per tick to each "host:port" client
+        self.telemetry_clients = []
+        self.telemetry_rate = 20.0
+        self.telemetry = None
+        self.metrics.add_source('capture', self.capture_metrics)
+        self.metrics.add_source('output', lambda: self.output_stage.progress())
+        self.metrics.add_source('last_take', lambda: dict(self.last_take_report or {}))
+        self.metrics.add_source('timings', lambda: dict(self.timings))
+        self.metrics.add_source('telemetry', lambda: self.telemetry.snapshot() if self.telemetry else {})
+
+        # Any PyAudio-style backend; a FakeBackend stands in for hardware.
+        # Without one, `backend_name` is only opened on first use.
+        self.audio_interface = backend
+        self.backend_name = backend_name
+        self.backend_options = backend_options or {}
+        self.interface_lock = threading.Lock()
+        self.load_config()
+        self.timings['engine_init_ms'] = (time.perf_counter() - created) * 1000
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def emit(self, event, **info):
+        for listener in self.listeners:
+            try:
+                listener(event, info)
+            except Exception as e:
+                print(f"Listener error for {event}: {e}")
+
+    def start(self):
+        # Lay out tracks from the cached catalogue, work out the next take
+        # and start OSC; the devices are opened in the background
+        self.update_tracks()
+        self.device_thread = threading.Thread(target=self.open_devices, name="DeviceStartup")
+        self.device_thread.daemon = True
+        self.device_thread.start()
+        self.take_index.watch(self.save_directory)
+        self.update_take_number()
+        if self.osc_enabled:
+            self.start_osc_server()
+        if self.telemetry_clients or self.osc_enabled:
+            self.start_telemetry()
+        if self.metrics_file or self.osc_enabled:
+            self.metrics_exporter = MetricsExporter(self.metrics, self.metrics_file or None,
+                                                    self.metrics_interval, self.send_osc_metrics)
+            self.metrics_exporter.start()
+
+    def get_audio_interface(self):
+        # Initialising PortAudio is where it probes every host API and
+        # device, so it happens on first use rather than at construction
+        with self.interface_lock:
+            if self.audio_interface is None:
+                start = time.perf_counter()
+                self.audio_interface = open_backend(self.backend_name, **self.backend_options)
+                self.timings['portaudio_init_ms'] = (time.perf_counter() - start) * 1000
+            return self.audio_interface
+
+    def scan_devices(self):
+        audio_interface = self.get_audio_interface()
+        start = time.perf_counter()
+        catalogue = []
+        for i in range(audio_interface.get_device_count()):
+            device_info = audio_interface.get_device_info_by_index(i)
+            # Only include devices with input channels
+            if device_info['maxInputChannels'] > 0:
+                catalogue.append({
+                    'name': device_info.get('name'),
+                    'index': i,
+                    'channels': device_info['maxInputChannels'],
+                    'sample_rate': int(device_info['defaultSampleRate']),
+                })
+        self.timings['enumeration_ms'] = (time.perf_counter() - start) * 1000
+        return catalogue
+
+    def set_device_catalogue(self, catalogue):
+        self.device_catalogue = [dict(device) for device in catalogue]
+        self.audio_devices = [device['name'] for device in self.device_catalogue]
+        self.device_indices = [device['index'] for device in self.device_catalogue]
+
+    def device_info(self, name):
+        for device in self.device_catalogue:
+            if device['name'] == name:
+                return device
+        return None
+
+    def validate_devices(self):
+        # Fall back to the first device if the saved one is gone, and keep
+        # the session only if all of it is still connected
+        if self.device_name not in self.audio_devices:
+            self.device_name = self.audio_devices[0] if self.audio_devices else ''
+        session = self.device_names
+        if session[:1] == [self.device_name] and all(name in self.audio_devices for name in session):
+            self.device_names = list(session)
+        else:
+            self.device_names = [self.device_name] if self.device_name else []
+
+    def cached_devices_match(self):
+        # A couple of index lookups: are the session's cached entries still
+        # the devices at those indices?
+        audio_interface = self.get_audio_interface()
+        for name in self.device_names:
+            device = self.device_info(name)
+            try:
+                info = audio_interface.get_device_info_by_index(device['index'])
+            except Exception:
+                return False
+            if info.get('name') != name or info['maxInputChannels'] != device['channels']:
+                return False
+        return bool(self.device_names)
+
+    def open_devices(self):
+        # Runs in the background after start(): bring up PortAudio, open the
+        # session straight from the cached catalogue if it still matches,
+        # then enumerate everything and publish any change
+        start = time.perf_counter()
+        try:
+            opened = False
+            if self.device_names and self.cached_devices_match():
+                with self.device_lock:
+                    self.select_devices(self.device_names)
+                opened = True
+                self.timings['first_stream_ms'] = (time.perf_counter() - start) * 1000
+            self.refresh_devices(reopen=not opened)
+        except Exception as e:
+            print(f"Device start-up error: {e}")
+            self.emit('error', title="Audio Devices", message=f"Failed to open audio devices: {e}")
+        finally:
+            self.timings['devices_ready_ms'] = (time.perf_counter() - start) * 1000
+            self.devices_ready.set()
+
+    def refresh_devices(self, reopen=False):
+        # Enumerate again and adopt the result; the session is reopened only
+        # if its own entries changed (or `reopen` asks for it)
+        catalogue = self.scan_devices()
+        with self.device_lock:
+            if catalogue == self.device_catalogue and not reopen:
+                return False
+            before = [self.device_info(name) for name in self.device_names]
+            changed = catalogue != self.device_catalogue
+            self.set_device_catalogue(catalogue)
+            self.validate_devices()
+            if changed:
+                self.emit('devices', names=list(self.audio_devices))
+            if reopen or before != [self.device_info(name) for name in self.device_names]:
+                if not self.take_running():
+                    self.select_devices(self.device_names)
+        return changed
+
+    def wait_for_devices(self, timeout=None):
+        return self.devices_ready.wait(timeout)
+
+    def load_config(self):
+        if os.path.exists(self.config_file):
+            with open(self.config_file, 'r') as f:
+                config = json.load(f)
+                self.save_directory = config.get('save_directory', '')
+                self.pre_roll_seconds = float(config.get('pre_roll_seconds', 0.0))
+                if config.get('output_format') in OUTPUT_FORMATS:
+                    self.output_format = config['output_format']
+                if config.get('sample_format') in SAMPLE_FORMATS:
+                    self.sample_format = config['sample_format']
+                self.analysis_enabled = bool(config.get('analysis', True))
+                self.raw_takes = bool(config.get('raw_takes', False))
+                self.header_interval = max(float(config.get('header_interval', 2.0)), 0.0)
+                self.telemetry_clients = list(config.get('telemetry_clients', []))
+                self.telemetry_rate = float(config.get('telemetry_rate', 20.0))
+                self.metrics_file = config.get('metrics_file', '')
+                self.metrics_interval = float(config.get('metrics_interval', 5.0))
+                self.device_name = config.get('last_device_name', '')
+                self.device_names = list(config.get('session_devices', []))
+                self.set_device_catalogue(config.get('device_catalogue', []))
+        # Without a cached catalogue the saved names are kept until the
+        # first enumeration can check them
+        if self.device_catalogue:
+            self.validate_devices()
+
+    def save_config(self):
+        config = {
+            'save_directory': self.save_directory,
+            'last_device_name': self.device_name,
+            'session_devices': self.device_names,
+            'device_catalogue': self.device_catalogue,
+            'pre_roll_seconds': self.pre_roll_seconds,
+            'output_format': self.output_format,
+            'sample_format': self.sample_format,
+            'analysis': self.analysis_enabled,
+            'raw_takes': self.raw_takes,
+            'header_interval': self.header_interval,
+            'telemetry_clients': self.telemetry_clients,
+            'telemetry_rate': self.telemetry_rate,
+            'metrics_file': self.metrics_file,
+            'metrics_interval': self.metrics_interval,
+        }
+        with open(self.config_file, 'w') as f:
+            json.dump(config, f)
+
+    def set_save_directory(self, directory):
+        self.save_directory = directory
+        self.take_index.watch(directory)
+        self.update_take_number()
+
+    def set_custom_name(self, name):
+        self.custom_name = name.strip()
+        self.update_take_number()
+
+    def get_session_device_indices(self):
+        return [self.device_indices[self.audio_devices.index(name)]
+                for name in self.device_names if name in self.audio_devices]
+
+    def select_device(self, name):
+        self.select_devices([name] if name else [])
+
+    def select_devices(self, names):
+        # Record several interfaces as one session: their channels become
+        # consecutive tracks in the order given, and the first device's
+        # clock is the one the others are aligned and resampled to
+        if self.take_running():
+            raise RecorderError("Recording", "The device can't be changed during a take.")
+        names = list(dict.fromkeys(names))
+        unknown = [name for name in names if name not in self.audio_devices]
+        if unknown:
+            raise RecorderError("Unknown Device", f"Audio device not found: {', '.join(unknown)}")
+        start = time.perf_counter()
+        with self.device_lock:
+            self.device_names = names
+            self.device_name = names[0] if names else ''
+            self.stop_monitoring()
+            self.update_tracks()
+            self.start_monitoring()
+        switch_ms = (time.perf_counter() - start) * 1000
+        self.timings['last_device_switch_ms'] = switch_ms
+        self.emit('device', name=self.device_name, names=list(names), channels=self.channels,
+                  sample_rate=self.sample_rate, switch_ms=switch_ms)
+
+    def update_tracks(self):
+        self.track_selected = []
+        self.meter = None
+        self.channels = 0
+        self.device_channels = []
+
+        # The session's channels from the catalogue; all devices run at the
+        # first one's rate
+        devices = [self.device_info(name) for name in self.device_names if name in self.audio_devices]
+        if not devices:
+            return
+
+        self.device_channels = [device['channels'] for device in devices]
+        self.channels = sum(self.device_channels)
+        self.sample_rate = devices[0]['sample_rate']
+        self.track_selected = [True] * self.channels
+        self.meter = LevelMeter(self.channels, self.sample_rate,
+                                attack_ms=self.meter_attack_ms, release_ms=self.meter_release_ms,
+                                peak_hold_seconds=self.peak_hold_seconds,
+                                sample_format=SAMPLE_FORMATS[self.sample_format])
+
+    def set_track_selected(self, track, selected):
+        if 0 <= track < len(self.track_selected):
+            self.track_selected[track] = bool(selected)
+
+    def selected_tracks(self):
+        return [i for i, selected in enumerate(self.track_selected) if selected]
+
+    def set_pre_roll(self, seconds):
+        seconds = max(float(seconds), 0.0)
+        if self.take_running() or seconds == self.pre_roll_seconds:
+            return
+        self.pre_roll_seconds = seconds
+        # The ring is preallocated, so a new length means a new stream
+        self.stop_monitoring()
+        self.start_monitoring()
+
+    def set_output_format(self, output_format):
+        if output_format not in OUTPUT_FORMATS:
+            raise RecorderError("Output Format", f"Unknown output format: {output_format}")
+        if output_format == 'flac' and not FLAC_AVAILABLE:
+            raise RecorderError("FLAC Unavailable", "Install the soundfile package to record FLAC.")
+        if output_format == 'flac' and SAMPLE_FORMATS[self.sample_format].flac_subtype is None:
+            raise RecorderError("Output Format", f"FLAC can't hold {self.sample_format} samples; record WAV instead.")
+        self.output_format = output_format
+
+    def set_sample_format(self, name):
+        if name not in SAMPLE_FORMATS:
+            raise RecorderError("Sample Format", f"Unknown sample format: {name}")
+        if self.take_running():
+            raise RecorderError("Recording", "The sample format can't be changed during a take.")
+        if self.output_format == 'flac' and SAMPLE_FORMATS[name].flac_subtype is None:
+            raise RecorderError("Sample Format", f"FLAC can't hold {name} samples; choose WAV output first.")
+        if name == self.sample_format:
+            return
+        self.sample_format = name
+        # The stream, ring and meter all work at the native width
+        self.stop_monitoring()
+        self.update_tracks()
+        self.start_monitoring()
+
+    def update_take_number(self):
+        if not self.save_directory or not self.custom_name:
+            self.take_number = 1
+            self.emit('take_number', take_number=self.take_number)
+            return
+
+        # From the index; an unseen folder is scanned in the background and
+        # reported through on_take_index_changed
+        take_number = self.take_index.next_take(self.save_directory, self.custom_name)
+        if take_number != self.take_number:
+            self.take_number = take_number
+            self.emit('take_number', take_number=self.take_number)
+
+    def on_take_index_changed(self, directory):
+        if not self.is_recording and self.save_directory and directory == os.path.abspath(self.save_directory):
+            self.update_take_number()
+
+    def start_recording(self, trigger_time=None):
+        if trigger_time is None:
+            trigger_time = time.perf_counter()
+        with self.control_lock:
+            if self.is_recording:
+                return  # Already recording
+
+            # The last take's thread still owns its reader and writer until
+            # its files are closed; a new take waits for that
+            if self.take_running():
+                raise RecorderError("Recording", "The last take is still being saved.")
+
+            if not self.save_directory:
+                raise RecorderError("No Save Directory", "Please select a save directory before recording.")
+
+            if not self.custom_name:
+                raise RecorderError("No Custom Name", "Please enter a custom name for the recordings.")
+
+            # Get selected tracks
+            tracks = self.selected_tracks()
+            if not tracks:
+                raise RecorderError("No Tracks Selected", "Please select at least one track to record.")
+
+            # Number the take from the index (only a folder never seen before
+            # waits for its first scan), then step past anything written
+            # since the last check
+            take_number = self.take_index.next_take(self.save_directory, self.custom_name, wait=True)
+            while self.take_index.is_taken(self.save_directory, self.custom_name, take_number, tracks):
+                take_number += 1
+            self.take_number = take_number
+
+            engine = self.capture_engine
+            if engine is None or not engine.is_active():
+                raise RecorderError("No Input Stream", "The selected audio device is not running.")
+
+            # Arm the take on the live stream at the trigger's frame
+            reader = engine.arm(trigger_time)
+            self.take_reader = reader
+            self.take_started = trigger_time
+            self.stop_time = None
+            self.is_recording = True
+
+            # Start recording thread; it gets everything naming the take so
+            # later changes to the folder or name apply to the next one
+            self.recording_thread = threading.Thread(
+                target=self.record,
+                args=(engine, reader, tracks, self.save_directory, self.custom_name, take_number))
+            self.recording_thread.start()
+
+        self.emit('state', recording=True)
+        # Send OSC message: recording started
+        self.send_osc_status()
+
+    def record(self, engine, reader, tracks, save_directory, custom_name, take_number):
+        # Open one streaming writer per selected track before the first read
+        writer = TakeWriter(save_directory, custom_name, take_number,
+                            tracks, engine.channels, engine.sample_rate,
+                            sample_format=engine.sample_format,
+                            pool=self.output_stage.write_pool, metrics=self.metrics,
+                            header_interval=self.header_interval, analyse=self.analysis_enabled,
+                            raw=self.raw_takes)
+        try:
+            writer.start()
+            self.take_index.add_take(save_directory, custom_name, writer.take_number)
+        except Exception as e:
+            writer.close()
+            self.emit('error', title="Error", message=f"Failed to open take files: {e}")
+            self.finish_recording(reader)
+            return
+        self.take_writer = writer
+
+        max_frames = engine.frames_per_buffer * READ_BUFFERS
+        while self.is_recording:
+            try:
+                data = reader.read(max_frames=max_frames, timeout=0.1)
+                if data:
+                    writer.write(data)
+                elif not engine.is_active():
+                    print("Recording error: input stream stopped")
+                    self.metrics.capture_errors += 1
+                    break
+            except Exception as e:
+                print(f"Recording error: {e}")
+                self.metrics.capture_errors += 1
+                break
+
+        # End the take at the stop trigger's frame and drain up to it
+        reader.disarm(self.stop_time)
+        while not reader.finished():
+            data = reader.read(max_frames=max_frames, timeout=0.1)
+            if data:
+                writer.write(data)
+            elif not engine.is_active():
+                break
+
+        # Drain the writer queue and finalize headers before judging the take
+        report = reader.report()
+        gaps = reader.has_gaps()
+        writer.close()
+        report['dropped_buffers'] = writer.dropped_buffers
+        report['gap_free'] = not gaps and not writer.dropped_buffers and writer.error is None
+        if writer.error is not None:
+            report['error'] = str(writer.error)
+        self.last_take_report = report
+        print(f"Take {take_number:04d} capture report: {report}")
+        if writer.error is not None:
+            self.emit('error', title="Recording Error",
+                      message=f"Take {take_number:04d} was not fully written: {writer.error}")
+        elif not report['gap_free']:
+            print(f"Warning: take {take_number:04d} has gaps (input overflows, underflows or ring overruns)")
+
+        self.save_recording(writer, report)
+        self.finish_recording(reader)
+
+    def finish_recording(self, reader):
+        with self.control_lock:
+            if self.take_reader is not reader:
+                return  # Another take has started since
+            self.take_writer = None
+            self.take_reader = None
+            self.is_recording = False
+            self.update_take_number()
+        self.emit('state', recording=False)
+        # Send OSC message: recording stopped
+        self.send_osc_status()
+
+    def take_running(self):
+        # True from the start of a take until its thread has drained the
+        # stream and closed the files, which outlasts is_recording
+        thread = self.recording_thread
+        return self.is_recording or (thread is not None and thread.is_alive())
+
+    def stop_recording(self, trigger_time=None):
+        with self.control_lock:
+            if self.is_recording:
+                self.stop_time = trigger_time if trigger_time is not None else time.perf_counter()
+                self.is_recording = False
+
+    def wait_for_take(self, timeout=None):
+        thread = self.recording_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def save_recording(self, writer, report):
+        # The writer is closed: report how the files were written and hand
+        # them on
+        if writer.raw:
+            # Split on the output stage; the recorder is free for the next
+            # take as soon as the raw file is closed
+            self.output_stage.split_take(writer.take_number, lambda: self.split_recording(writer, report))
+            return
+        for track, rate in writer.track_throughput().items():
+            print(f"Track {track + 1}: {writer.track_bytes[track]} bytes at {rate:.1f} MB/s")
+        self.publish_take(writer, report)
+
+    def split_recording(self, writer, report):
+        error = writer.error
+        writer.split_tracks()
+        print(f"Split {len(writer.tracks)} track(s) from {os.path.basename(writer.raw_path())} "
+              f"in {writer.split_seconds:.2f} s")
+        report['split_seconds'] = writer.split_seconds
+        if writer.error is not error:
+            report['error'] = str(writer.error)
+            report['gap_free'] = False
+            self.emit('error', title="Split Error",
+                      message=f"Tracks of take {writer.take_number:04d} could not be split: {writer.error}")
+        self.publish_take(writer, report)
+
+    def publish_take(self, writer, report):
+        if writer.analysis:
+            self.publish_analysis(writer, report)
+
+        # Hand the finished WAVs to the encoder pool; the next take can start
+        # while they encode.
+        if self.output_format == 'flac' and writer.error is None:
+            try:
+                self.output_stage.encode_take(writer.take_number, writer.paths())
+            except Exception as e:
+                print(f"Encode error: {e}")
+
+    def publish_analysis(self, writer, report):
+        tracks = {track + 1: figures for track, figures in sorted(writer.analysis.items())}
+        self.last_take_analysis = {'name': writer.custom_name, 'take': writer.take_number, 'tracks': tracks}
+        report['silent_tracks'] = [track for track, figures in tracks.items() if figures['silent']]
+        report['clipped_tracks'] = [track for track, figures in tracks.items() if figures['clipped_samples']]
+        self.emit('analysis', **self.last_take_analysis)
+        if self.osc_client is not None:
+            self.osc_client.send_message("/take_analysis", json.dumps(self.last_take_analysis))
+
+    def export_tracks(self, take, tracks, name=None):
+        # Split more tracks out of a raw take after the fact; existing track
+        # files are left alone. Returns {track: path} for the tracks written.
+        name = name or self.custom_name
+        path = raw_path(self.save_directory, name, take)
+        if not self.save_directory or not os.path.exists(path):
+            raise RecorderError("No Raw Take", f"Take {take:04d} of {name} wasn't recorded raw.")
+        with RawTake(path) as raw:
+            paths = {track: track_path(self.save_directory, name, take, track)
+                     for track in dict.fromkeys(tracks) if 0 <= track < raw.channels}
+            tracks = [track for track, path in paths.items()
+                      if not any(os.path.exists(os.path.splitext(path)[0] + '.' + extension)
+                                 for extension in TAKE_EXTENSIONS)]
+            paths = {track: paths[track] for track in tracks}
+            start = time.perf_counter()
+            raw.export(tracks, paths, analyse=self.analysis_enabled, pool=self.output_stage.write_pool,
+                       header_interval=self.header_interval)
+        print(f"Exported {len(tracks)} track(s) from take {take:04d} in {time.perf_counter() - start:.2f} s")
+        if self.output_format == 'flac' and tracks:
+            self.output_stage.encode_take(take, list(paths.values()))
+        return paths
+
+    def take_analysis(self, name=None, take=None):
+        # Per-track figures for a take in the save directory (the last one
+        # by default); tracks without a current sidecar are analysed first
+        name = name or self.custom_name
+        if take is None:
+            last = self.last_take_analysis
+            if last is not None and last['name'] == name:
+                return last
+            take = self.take_index.next_take(self.save_directory, name) - 1
+        tracks = analyse_take(self.save_directory, name, take) if self.save_directory else {}
+        return {'name': name, 'take': take, 'tracks': tracks}
+
+    def update_levels(self, data):
+        # Audio side only overwrites the shared meter state; front ends pick
+        # up the latest values on their own schedule.
+        meter = self.meter
+        if meter is not None:
+            start = time.perf_counter()
+            meter.process(data)
+            self.metrics.meter_update_ms.record((time.perf_counter() - start) * 1000)
+
+    def start_monitoring(self):
+        device_indices = self.get_session_device_indices()
+        if not device_indices:
+            return
+
+        # Open the long-lived input streams, one per session device; takes
+        # are armed on them later
+        audio_interface = self.get_audio_interface()
+        with self.monitor_lock:
+            engines = [CaptureEngine(audio_interface, device_index, channels, self.sample_rate,
+                                     sample_format=SAMPLE_FORMATS[self.sample_format],
+                                     pre_roll_seconds=self.pre_roll_seconds, metrics=self.metrics)
+                       for device_index, channels in zip(device_indices, self.device_channels)]
+            engine = engines[0] if len(engines) == 1 else CaptureSession(engines, self.device_names)
+            try:
+                engine.start()
+            except Exception as e:
+                print(f"Monitoring error: {e}")
+                return
+            self.capture_engine = engine
+        print(f"Input ring: {engine.memory_bytes()} bytes for {self.pre_roll_seconds:g} s pre-roll")
+
+        self.monitoring = True
+        self.monitoring_thread = threading.Thread(target=self.monitor_levels, args=(engine,))
+        self.monitoring_thread.daemon = True
+        self.monitoring_thread.start()
+        self.emit('monitoring', active=True, memory_bytes=engine.memory_bytes(),
+                  pre_roll_seconds=self.pre_roll_seconds)
+
+    def stop_monitoring(self):
+        if self.monitoring:
+            self.monitoring = False
+            if self.monitor_thread_is_alive():
+                self.monitoring_thread.join()
+        with self.monitor_lock:
+            if self.capture_engine is not None:
+                self.capture_engine.stop()
+                self.capture_engine = None
+                self.emit('monitoring', active=False)
+
+    def monitor_thread_is_alive(self):
+        return self.monitoring_thread is not None and self.monitoring_thread.is_alive()
+
+    def monitor_levels(self, engine):
+        reader = engine.open_reader()
+        while self.monitoring:
+            try:
+                data = reader.read(timeout=0.1)
+                if data:
+                    self.update_levels(data)
+                elif not engine.is_active():
+                    print("Monitoring error: input stream stopped")
+                    self.metrics.capture_errors += 1
+                    break
+                time.sleep(0.02)  # Let a few buffers collect between meter updates
+            except Exception as e:
+                # Handle exceptions (e.g., device disconnection)
+                print(f"Monitoring error: {e}")
+                self.metrics.capture_errors += 1
+                break
+
+    # OSC Integration
+    def start_osc_server(self):
+        # Set up dispatcher
+        self.dispatcher = dispatcher.Dispatcher()
+        self.dispatcher.map("/start_recording", self.osc_start_recording)
+        self.dispatcher.map("/stop_recording", self.osc_stop_recording)
+        self.dispatcher.map("/get_analysis", self.osc_get_analysis)
+        self.dispatcher.map("/get_overview", self.osc_get_overview)
+        self.dispatcher.map("/analyse_session", self.osc_analyse_session)
+        self.dispatcher.map("/export_tracks", self.osc_export_tracks)
+        self.dispatcher.map("/subscribe_telemetry", self.osc_subscribe_telemetry, needs_reply_address=True)
+        self.dispatcher.map("/unsubscribe_telemetry", self.osc_unsubscribe_telemetry, needs_reply_address=True)
+        # Create OSC server
+        self.server = osc_server.ThreadingOSCUDPServer((self.osc_ip, self.osc_port), self.dispatcher)
+        print(f"Serving OSC on {self.server.server_address}")
+        # Start server thread
+        self.osc_server_thread = threading.Thread(target=self.server.serve_forever)
+        self.osc_server_thread.daemon = True
+        self.osc_server_thread.start()
+        # Set up OSC client for broadcasting status
+        self.osc_client = udp_client.SimpleUDPClient(self.osc_ip, self.osc_port)
+
+        # Broadcast initial status
+        self.send_osc_status()
+
+    def osc_start_recording(self, addr, *args):
+        trigger_time = time.perf_counter()
+        print("OSC command received: Start Recording")
+        try:
+            self.start_recording(trigger_time)
+        except RecorderError as e:
+            print(f"OSC start refused: {e.message}")
+            self.emit('error', title=e.title, message=e.message)
+
+    def osc_stop_recording(self, addr, *args):
+        trigger_time = time.perf_counter()
+        print("OSC command received: Stop Recording")
+        self.stop_recording(trigger_time)
+
+    def osc_get_analysis(self, addr, *args):
+        # [name [take]] -> /analysis with the take's per-track JSON
+        name = str(args[0]) if args else None
+        take = int(args[1]) if len(args) > 1 else None
+        try:
+            analysis = self.take_analysis(name, take)
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"OSC analysis error: {e}")
+            return
+        if self.osc_client is not None:
+            self.osc_client.send_message("/analysis", json.dumps(analysis))
+
+    def osc_get_overview(self, addr, *args):
+        # name take track [level] -> /overview messages carrying int16
+        # min/max pairs as blobs, OVERVIEW_CHUNK pairs at a time so each fits
+        # a datagram: name, take, track, samples per bin, first bin, total
+        # bins, pairs
+        if len(args) < 3 or self.osc_client is None or not self.save_directory:
+            return
+        name, take, track = str(args[0]), int(args[1]), int(args[2])
+        level = int(args[3]) if len(args) > 3 else 0
+        path = take_files(self.save_directory, name, take).get((name, take, track))
+        if path is None:
+            print(f"OSC overview: no track {track} in take {take:04d} of {name}")
+            return
+        try:
+            overviews = load_analysis(path)['overviews']
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"OSC overview error: {e}")
+            return
+        samples_per_bin, pairs = overviews[min(max(level, 0), len(overviews) - 1)]
+        for first in range(0, max(len(pairs), 1), OVERVIEW_CHUNK):
+            chunk = pairs[first:first + OVERVIEW_CHUNK]
+            self.osc_client.send_message("/overview", [name, take, track, samples_per_bin, first, len(pairs),
+                                                       chunk.tobytes()])
+
+    def osc_export_tracks(self, addr, *args):
+        # take track [track ...] -> /tracks_exported with the new files;
+        # tracks are one-based as in the file names
+        if len(args) < 2:
+            return
+        take = int(args[0])
+        try:
+            paths = self.export_tracks(take, [int(track) - 1 for track in args[1:]])
+        except RecorderError as e:
+            print(f"OSC export refused: {e.message}")
+            return
+        except (OSError, ValueError) as e:
+            print(f"OSC export error: {e}")
+            return
+        if self.osc_client is not None:
+            exported = {track + 1: os.path.basename(path) for track, path in paths.items()}
+            self.osc_client.send_message("/tracks_exported", json.dumps({'take': take, 'tracks': exported}))
+
+    def osc_analyse_session(self, addr, *args):
+        # Bring the save directory's sidecars up to date off the server
+        # thread; replies with one /session_analysis message per track it
+        # had to decode, so each fits a datagram: index, total, file name,
+        # summary JSON (a single message with total 0 if none needed it)
+        directory = self.save_directory
+        if not directory:
+            return
+
+        def run():
+            try:
+                analysed = sorted(analyse_directory(directory).items())
+                if self.osc_client is None:
+                    return
+                if not analysed:
+                    self.osc_client.send_message("/session_analysis", [0, 0, "", "{}"])
+                for index, (filename, figures) in enumerate(analysed):
+                    self.osc_client.send_message("/session_analysis",
+                                                 [index, len(analysed), filename, json.dumps(figures)])
+            except Exception as e:
+                print(f"OSC session analysis error: {e}")
+        thread = threading.Thread(target=run, name="SessionAnalysis")
+        thread.daemon = True
+        thread.start()
+
+    def start_telemetry(self):
+        clients = []
+        for text in self.telemetry_clients:
+            try:
+                clients.append(parse_client(text))
+            except (ValueError, OSError) as e:
+                print(f"Telemetry client skipped: {e}")
+        self.telemetry = TelemetryPublisher(lambda: self.meter, self.take_state, self.telemetry_rate, clients)
+        self.telemetry.start()
+
+    def take_state(self):
+        # (recording, take number, elapsed seconds, bytes written) for telemetry
+        recording = self.is_recording
+        started = self.take_started
+        writer = self.take_writer
+        elapsed = time.perf_counter() - started if recording and started is not None else 0.0
+        return recording, self.take_number, elapsed, writer.bytes_written() if writer is not None else 0
+
+    def osc_subscribe_telemetry(self, client_address, addr, *args):
+        # [port] -> telemetry to the sender's address, on `port` if given
+        if self.telemetry is None:
+            return
+        port = int(args[0]) if args else client_address[1]
+        try:
+            self.telemetry.add_client((client_address[0], port))
+        except OSError as e:
+            print(f"Telemetry subscribe error: {e}")
+            return
+        print(f"Telemetry subscribed: {client_address[0]}:{port}")
+
+    def osc_unsubscribe_telemetry(self, client_address, addr, *args):
+        if self.telemetry is None:
+            return
+        port = int(args[0]) if args else client_address[1]
+        self.telemetry.remove_client((client_address[0], port))
+        print(f"Telemetry unsubscribed: {client_address[0]}:{port}")
+
+    def send_osc_status(self):
+        if self.osc_client is None:
+            return
+        status = "recording" if self.is_recording else "idle"
+        self.osc_client.send_message("/recorder_status", status)
+        print(f"OSC status broadcasted: {status}")
+
+    def capture_metrics(self):
+        engine = self.capture_engine
+        if engine is None:
+            return {'active': False}
+        counters = engine.counters()
+        counters['active'] = engine.is_active()
+        counters['ring_memory_bytes'] = engine.memory_bytes()
+        reader = self.take_reader
+        if self.is_recording and reader is not None:
+            counters['take_backlog_frames'] = reader.available()
+            counters['take_ring_overruns'] = reader.overruns
+        writer = self.take_writer
+        if writer is not None:
+            counters['writer_queue_depth'] = writer.queue.qsize()
+            counters['writer_dropped_buffers'] = writer.dropped_buffers
+        if isinstance(engine, CaptureSession):
+            for number, device in enumerate(engine.device_report(), 1):
+                counters[f'device{number}_drift_ppm'] = device['drift_ppm']
+                counters[f'device{number}_latency_ms'] = device['latency_ms']
+        return counters
+
+    def send_osc_metrics(self, snapshot):
+        # Broadcast next to /recorder_status as one compact JSON string
+        if self.osc_client is None:
+            return
+        self.osc_client.send_message("/recorder_metrics", json.dumps(summary(snapshot)))
+
+    def close(self, save_config=True):
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+            self.metrics_exporter = None
+        if self.telemetry is not None:
+            self.telemetry.stop()
+            self.telemetry = None
+        self.stop_recording()
+        self.wait_for_take()
+        if self.device_thread is not None:
+            self.device_thread.join()
+            self.device_thread = None
+        self.take_index.close()
+        if save_config:
+            self.save_config()
+        self.stop_monitoring()
+        self.output_stage.shutdown()
+        if self.audio_interface is not None:
+            self.audio_interface.terminate()
+            self.audio_interface = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def parse_tracks(text):
+    # "1,2,5-8" -> zero-based track indices
+    tracks = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            tracks.extend(range(int(first) - 1, int(last)))
+        else:
+            tracks.append(int(part) - 1)
+    return tracks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless multi-track recorder, controlled over OSC.")
+    parser.add_argument('--config', default='config.json', help="Config file to read settings from")
+    parser.add_argument('--list-devices', action='store_true', help="List input devices and exit")
+    parser.add_argument('--device', action='append',
+                        help="Input device name (defaults to last_device_name); repeat to record several as one session")
+    parser.add_argument('--save-directory', help="Directory for take files")
+    parser.add_argument('--name', help="Custom name used in take file names")
+    parser.add_argument('--tracks', help="Tracks to record, e.g. 1,2,5-8 (default: all)")
+    parser.add_argument('--pre-roll', type=float, help="Seconds of audio kept from before each trigger")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, help="Output format")
+    parser.add_argument('--sample-format', choices=tuple(SAMPLE_FORMATS), help="Capture sample format")
+    parser.add_argument('--raw-takes', action='store_true',
+                        help="Also keep each take's interleaved stream, to export other tracks later")
+    parser.add_argument('--export', type=int, metavar='TAKE',
+                        help="Split --tracks out of this raw take of --name, then exit")
+    parser.add_argument('--no-analysis', action='store_true', help="Don't write analysis sidecars while recording")
+    parser.add_argument('--header-interval', type=float,
+                        help="Seconds between WAV header refreshes while recording (the most a crash can lose)")
+    parser.add_argument('--osc-ip', default="192.168.1.72")
+    parser.add_argument('--osc-port', type=int, default=4565)
+    parser.add_argument('--no-osc', action='store_true', help="Don't start the OSC server")
+    parser.add_argument('--duration', type=float, help="Record one take of this many seconds, then exit")
+    parser.add_argument('--save-config', action='store_true', help="Write the settings used back to the config file")
+    parser.add_argument('--backend', choices=BACKENDS, default='pyaudio', help="Audio backend ('fake' simulates a device)")
+    parser.add_argument('--fake-channels', type=int, default=8)
+    parser.add_argument('--fake-rate', type=int, default=48000)
+    parser.add_argument('--fake-jitter-ms', type=float, default=0.0)
+    parser.add_argument('--fake-devices', type=int, default=1, help="Number of fake devices")
+    parser.add_argument('--fake-drift-ppm', type=float, default=0.0, help="Clock offset between fake devices")
+    parser.add_argument('--fake-probe-ms', type=float, default=0.0, help="Time each fake device info query takes")
+    parser.add_argument('--telemetry', action='append', metavar='HOST:PORT',
+                        help="Send live meter and take telemetry here; repeat for several clients")
+    parser.add_argument('--telemetry-rate', type=float, help="Telemetry bundles per second")
+    parser.add_argument('--metrics-file', help="Write a JSON metrics snapshot to this file periodically")
+    parser.add_argument('--metrics-interval', type=float, help="Seconds between metrics snapshots")
+    args = parser.parse_args(argv)
+
+    backend_options = {}
+    if args.backend == 'fake':
+        backend_options = dict(channels=args.fake_channels, sample_rate=args.fake_rate,
+                               jitter_ms=args.fake_jitter_ms, device_count=args.fake_devices,
+                               drift_ppm=args.fake_drift_ppm, probe_ms=args.fake_probe_ms)
+    engine = RecorderEngine(config_file=args.config, osc_ip=args.osc_ip, osc_port=args.osc_port,
+                            osc=not args.no_osc, backend_name=args.backend, backend_options=backend_options)
+    if args.list_devices:
+        engine.set_device_catalogue(engine.scan_devices())
+        for name, index in zip(engine.audio_devices, engine.device_indices):
+            print(f"{index}: {name}")
+        engine.close(save_config=False)
+        return 0
+
+    if args.export is not None:
+        try:
+            if args.save_directory is not None:
+                engine.save_directory = args.save_directory
+            if not args.tracks:
+                print("--export needs --tracks")
+                return 1
+            engine.analysis_enabled = not args.no_analysis
+            if args.header_interval is not None:
+                engine.header_interval = max(args.header_interval, 0.0)
+            if args.format is not None:
+                engine.set_output_format(args.format)
+            paths = engine.export_tracks(args.export, parse_tracks(args.tracks), args.name)
+            for track, path in paths.items():
+                print(f"Track {track + 1}: {path}")
+            while engine.output_stage.busy():
+                time.sleep(0.2)
+        except RecorderError as e:
+            print(f"{e.title}: {e.message}")
+            return 1
+        finally:
+            engine.close(save_config=False)
+        return 0
+
+    def report(event, info):
+        if event == 'error':
+            print(f"{info['title']}: {info['message']}")
+        elif event == 'take_number':
+            print(f"Next take number: {info['take_number']:04d}")
+        elif event == 'state':
+            print("Status: Recording..." if info['recording'] else "Status: Idle")
+        elif event == 'analysis':
+            for track, figures in info['tracks'].items():
+                print(f"Track {track}: {json.dumps(figures)}")
+    engine.add_listener(report)
+
+    try:
+        if args.device:
+            if not all(name in engine.audio_devices for name in args.device):
+                # Not in the cached catalogue; enumerate now before giving up
+                engine.set_device_catalogue(engine.scan_devices())
+            for name in args.device:
+                if name not in engine.audio_devices:
+                    print(f"Unknown device: {name}")
+                    return 1
+            engine.device_name = args.device[0]
+            engine.device_names = list(dict.fromkeys(args.device))
+        if args.save_directory is not None:
+            if not os.path.isdir(args.save_directory):
+                print(f"Save directory not found: {args.save_directory}")
+                return 1
+            engine.save_directory = args.save_directory
+        if args.name is not None:
+            engine.set_custom_name(args.name)
+        if args.pre_roll is not None:
+            engine.pre_roll_seconds = max(args.pre_roll, 0.0)
+        if args.sample_format is not None:
+            engine.sample_format = args.sample_format
+        # Re-checked even when only the sample format changed
+        engine.set_output_format(args.format if args.format is not None else engine.output_format)
+        if args.telemetry:
+            for text in args.telemetry:
+                try:
+                    parse_client(text)
+                except ValueError as e:
+                    print(e)
+                    return 1
+            engine.telemetry_clients = list(dict.fromkeys(engine.telemetry_clients + args.telemetry))
+        if args.telemetry_rate is not None:
+            engine.telemetry_rate = max(args.telemetry_rate, 0.1)
+        if args.no_analysis:
+            engine.analysis_enabled = False
+        if args.raw_takes:
+            engine.raw_takes = True
+        if args.header_interval is not None:
+            engine.header_interval = max(args.header_interval, 0.0)
+        if args.metrics_file is not None:
+            engine.metrics_file = args.metrics_file
+        if args.metrics_interval is not None:
+            engine.metrics_interval = args.metrics_interval
+        engine.start()
+        engine.wait_for_devices()
+        if args.tracks:
+            selected = set(parse_tracks(args.tracks))
+            for track in range(engine.channels):
+                engine.set_track_selected(track, track in selected)
+
+        if args.duration is not None:
+            engine.start_recording()
+            time.sleep(args.duration)
+            engine.stop_recording()
+            engine.wait_for_take()
+            # Let background encodes finish before the process exits
+            while engine.output_stage.busy():
+                time.sleep(0.2)
+        else:
+            print("Recorder running; press Ctrl+C to quit")
+            while True:
+                time.sleep(1)
+    except RecorderError as e:
+        print(f"{e.title}: {e.message}")
+        return 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close(save_config=args.save_config)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
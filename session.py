@@ -0,0 +1,216 @@
+import math
+import time
+
+import numpy as np
+
+from dsp import as_frames, pack, unpack
+
+# Largest rate correction applied to a follower in one block, as a ratio.
+# Real clocks differ by tens of ppm; the limit only stops a bad clock
+# estimate from audibly warping pitch.
+MAX_CORRECTION = 0.001
+# How long a follower waits for its device to catch up with a master block
+FOLLOW_TIMEOUT = 0.25
+# Distance from the clocks' estimate past which a follower jumps instead
+RESYNC_FRAMES = 8192
+
+
+class DeviceFollower:
+    # Reads one non-master device of a session in step with the master. For
+    # each master block it works out from both sample clocks which stretch of
+    # this device's frames covers the same time, and linearly interpolates
+    # that stretch onto the master's frame count. The read position carries
+    # over between blocks as a fraction, so blocks join without clicks and
+    # drift is absorbed a fraction of a sample at a time.
+
+    def __init__(self, engine, master, position):
+        self.engine = engine
+        self.master = master
+        self.start_position = position
+        self.position = position
+        self.ratio = 1.0
+        self.frames_out = 0
+        self.missing_frames = 0
+        self.resyncs = 0
+        self.baseline = engine.counters()
+
+    def follow(self, master_frame, frames):
+        engine = self.engine
+        ring = engine.ring
+        expected = engine.clock.frame_at(self.master.clock.time_of(master_frame))
+        oldest = ring.write_frame - ring.capacity_frames + engine.frames_per_buffer
+        if self.position < oldest or abs(self.position - expected) > RESYNC_FRAMES:
+            # Fell out of the ring or far off the clocks (after a stall):
+            # jump back onto the estimate rather than slew for seconds
+            self.position = expected
+            self.resyncs += 1
+        target = engine.clock.frame_at(self.master.clock.time_of(master_frame + frames))
+        ratio = (target - self.position) / frames
+        self.ratio = min(max(ratio, 1.0 - MAX_CORRECTION), 1.0 + MAX_CORRECTION)
+
+        positions = self.position + self.ratio * np.arange(frames)
+        first = int(math.floor(positions[0]))
+        last = int(math.floor(positions[-1])) + 1
+        deadline = time.monotonic() + FOLLOW_TIMEOUT
+        while ring.write_frame <= last and time.monotonic() < deadline and engine.is_active():
+            time.sleep(ring.poll_interval)
+
+        self.position += self.ratio * frames
+        self.frames_out += frames
+        fmt = engine.sample_format
+        if ring.write_frame <= last or first < ring.write_frame - ring.capacity_frames:
+            # The device stalled or the data is gone; keep the track set in
+            # step with silence
+            self.missing_frames += frames
+            return pack(np.zeros((frames, engine.channels)), fmt)
+
+        data = ring.copy_out(first, last - first + 1)
+        samples = unpack(as_frames(data, engine.channels, fmt), fmt).astype(np.float64)
+        offsets = positions - first
+        index = offsets.astype(np.intp)
+        fraction = (offsets - index)[:, None]
+        resampled = samples[index] * (1.0 - fraction) + samples[index + 1] * fraction
+        return pack(resampled, fmt)
+
+    def report(self):
+        counters = self.engine.counters()
+        report = {key: counters[key] - self.baseline[key] for key in counters}
+        report.update({
+            'start_position': self.start_position,
+            # Device frames absorbed (positive) or repeated by resampling
+            'correction_frames': (self.position - self.start_position) - self.frames_out,
+            'missing_frames': self.missing_frames,
+            'resyncs': self.resyncs,
+        })
+        return report
+
+
+class CaptureSession:
+    # Several input devices recorded as one. Each device keeps its own
+    # CaptureEngine (callback thread and ring); the first is the clock
+    # master and the others follow it through DeviceFollowers. Readers
+    # return one interleaved stream with every device's channels side by
+    # side in session order, so the take writer, meters and track numbering
+    # see a single wide device.
+
+    def __init__(self, engines, names=None):
+        self.engines = list(engines)
+        self.names = list(names) if names is not None else [str(e.device_index) for e in self.engines]
+        self.master = self.engines[0]
+        self.channels = sum(engine.channels for engine in self.engines)
+        self.sample_rate = self.master.sample_rate
+        self.sample_format = self.master.sample_format
+        self.frames_per_buffer = self.master.frames_per_buffer
+        self.metrics = self.master.metrics
+
+    def start(self):
+        started = []
+        try:
+            for engine in self.engines:
+                engine.start()
+                started.append(engine)
+        except Exception:
+            for engine in started:
+                engine.stop()
+            raise
+
+    def stop(self):
+        for engine in self.engines:
+            engine.stop()
+
+    def is_active(self):
+        return all(engine.is_active() for engine in self.engines)
+
+    def memory_bytes(self):
+        return sum(engine.memory_bytes() for engine in self.engines)
+
+    def counters(self):
+        totals = {}
+        for engine in self.engines:
+            for key, value in engine.counters().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def followers_at(self, master_frame):
+        when = self.master.clock.time_of(master_frame)
+        return [DeviceFollower(engine, self.master, engine.clock.frame_at(when)) for engine in self.engines[1:]]
+
+    def open_reader(self):
+        reader = self.master.open_reader()
+        return SessionReader(self, reader, self.followers_at(reader.read_frame))
+
+    def arm(self, trigger_time=None):
+        # The master picks the start frame (pre-roll included); each
+        # follower starts at the frame its clock puts at the same instant
+        reader = self.master.arm(trigger_time)
+        return SessionTakeReader(self, reader, self.followers_at(reader.start_frame))
+
+    def device_report(self):
+        master_rate = self.master.clock.rate()
+        report = []
+        for i, (name, engine) in enumerate(zip(self.names, self.engines)):
+            rate = engine.clock.rate()
+            report.append({
+                'name': name,
+                'channels': engine.channels,
+                'clock_rate': rate,
+                'drift_ppm': (rate / master_rate - 1.0) * 1e6 if i else 0.0,
+                'latency_ms': engine.clock.latency() * 1000,
+            })
+        return report
+
+
+class SessionReader:
+    # Master reader plus one follower per other device; read() returns
+    # combined interleaved frames.
+
+    def __init__(self, session, reader, followers):
+        self.session = session
+        self.reader = reader
+        self.followers = followers
+
+    @property
+    def read_frame(self):
+        return self.reader.read_frame
+
+    @property
+    def overruns(self):
+        return self.reader.overruns
+
+    def available(self):
+        return self.reader.available()
+
+    def read(self, max_frames=None, timeout=None):
+        data = self.reader.read(max_frames, timeout)
+        if not data or not self.followers:
+            return data
+        master = self.session.master
+        frames = len(data) // master.frame_bytes
+        first = self.reader.read_frame - frames
+        blocks = [as_frames(data, master.channels, master.sample_format)]
+        for follower in self.followers:
+            blocks.append(follower.follow(first, frames))
+        return np.concatenate(blocks, axis=1).tobytes()
+
+
+class SessionTakeReader(SessionReader):
+    # A take across the session: the master's TakeReader decides where the
+    # take starts and ends, and the report adds drift, latency and
+    # correction figures for every device.
+
+    def disarm(self, stop_time=None):
+        self.reader.disarm(stop_time)
+
+    def finished(self):
+        return self.reader.finished()
+
+    def report(self):
+        report = self.reader.report()
+        devices = self.session.device_report()
+        for device, follower in zip(devices[1:], self.followers):
+            device.update(follower.report())
+        report['devices'] = devices
+        return report
+
+    def has_gaps(self):
+        return self.reader.has_gaps() or any(f.missing_frames or f.resyncs for f in self.followers)
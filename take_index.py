@@ -0,0 +1,188 @@
+import json
+import os
+import re
+import threading
+
+# Per-track files, plus the interleaved _raw.wav of a take recorded raw
+TAKE_PATTERN = re.compile(r"(.+)_(\d{4})_(?:\d+|raw)\.(?:wav|flac)$")
+TAKE_EXTENSIONS = ('wav', 'flac')
+
+
+class TakeIndex:
+    # Highest take number per name for each save directory, so numbering the
+    # next take is a dictionary lookup rather than a listing of the folder.
+    # Entries persist to `path` together with the directory's mtime. A
+    # background thread stats the watched directory every `check_interval`
+    # seconds and rescans it (one scandir pass, all names at once) only when
+    # that mtime has moved. Takes the recorder opens itself are added
+    # directly as they start.
+
+    def __init__(self, path=None, check_interval=2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.directories = {}  # Directory -> {'mtime_ns': int, 'takes': {name: highest take}}
+        self.scans = {}  # Directory -> Event set when its scan in flight finishes
+        self.listeners = []
+        self.watched = None
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.load()
+
+    def add_listener(self, listener):
+        # Called with the directory whenever a scan changes its entry
+        self.listeners.append(listener)
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                directories = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Take index load error: {e}")
+            return
+        for directory, entry in directories.items():
+            self.directories[directory] = {
+                'mtime_ns': int(entry.get('mtime_ns', 0)),
+                'takes': {name: int(take) for name, take in entry.get('takes', {}).items()},
+            }
+
+    def save(self):
+        with self.lock:
+            if not self.path or not self.dirty:
+                return
+            directories = {directory: {'mtime_ns': entry['mtime_ns'], 'takes': dict(entry['takes'])}
+                           for directory, entry in self.directories.items()}
+            self.dirty = False
+        try:
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(directories, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Take index save error: {e}")
+
+    def key(self, directory):
+        return os.path.abspath(directory)
+
+    def directory_mtime(self, directory):
+        try:
+            return os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+
+    def scan(self, directory):
+        directory = self.key(directory)
+        # Stat before listing, so a file landing mid-scan still moves the
+        # mtime past what is stored and triggers another pass
+        mtime_ns = self.directory_mtime(directory)
+        takes = {}
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    match = TAKE_PATTERN.match(entry.name)
+                    if match:
+                        name, take = match.group(1), int(match.group(2))
+                        if take > takes.get(name, 0):
+                            takes[name] = take
+        except OSError as e:
+            print(f"Take index scan error: {e}")
+            return
+        with self.lock:
+            # A take the recorder opened mid-scan may be missing here; the
+            # mtime stored is from before the listing, so the next check
+            # rescans and picks it up.
+            previous = self.directories.get(directory)
+            self.directories[directory] = {'mtime_ns': mtime_ns or 0, 'takes': takes}
+            self.dirty = True
+            changed = previous is None or previous['takes'] != takes
+        if changed:
+            for listener in self.listeners:
+                try:
+                    listener(directory)
+                except Exception as e:
+                    print(f"Take index listener error: {e}")
+
+    def refresh(self, directory, wait=False):
+        # Rescan off the caller's thread; concurrent requests share one scan
+        directory = self.key(directory)
+        with self.lock:
+            done = self.scans.get(directory)
+            if done is None:
+                done = self.scans[directory] = threading.Event()
+                thread = threading.Thread(target=self.run_scan, args=(directory, done), name="TakeIndexScan")
+                thread.daemon = True
+                thread.start()
+        if wait:
+            done.wait()
+
+    def run_scan(self, directory, done):
+        try:
+            self.scan(directory)
+        finally:
+            with self.lock:
+                self.scans.pop(directory, None)
+            done.set()
+
+    def next_take(self, directory, name, wait=False):
+        # From memory. A directory never seen before is scanned in the
+        # background (or waited for, if asked) and reported to listeners.
+        directory = self.key(directory)
+        if directory not in self.directories:
+            self.refresh(directory, wait=wait)
+        with self.lock:
+            entry = self.directories.get(directory)
+            return (entry['takes'].get(name, 0) if entry else 0) + 1
+
+    def add_take(self, directory, name, take):
+        directory = self.key(directory)
+        with self.lock:
+            entry = self.directories.setdefault(directory, {'mtime_ns': 0, 'takes': {}})
+            if take > entry['takes'].get(name, 0):
+                entry['takes'][name] = take
+            # Our own files moved the mtime; don't rescan on their account
+            entry['mtime_ns'] = self.directory_mtime(directory) or 0
+            self.dirty = True
+
+    def is_taken(self, directory, name, take, tracks):
+        # Guards against files another machine wrote since the last scan.
+        # A take's first track (as WAV, or FLAC once encoded) or its raw
+        # file stands for the whole take, so this is at most three stats
+        # however many tracks are armed; the background check catches the
+        # rest.
+        paths = [os.path.join(directory, f"{name}_{take:04d}_raw.wav")]
+        if tracks:
+            paths += [os.path.join(directory, f"{name}_{take:04d}_{tracks[0] + 1}.{extension}")
+                      for extension in TAKE_EXTENSIONS]
+        return any(os.path.exists(path) for path in paths)
+
+    def watch(self, directory):
+        self.watched = self.key(directory) if directory else None
+        self.check()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="TakeIndex")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def check(self):
+        # One stat; a listing only if the directory changed behind our back
+        directory = self.watched
+        if directory:
+            entry = self.directories.get(directory)
+            mtime_ns = self.directory_mtime(directory)
+            if mtime_ns is not None and (entry is None or entry['mtime_ns'] != mtime_ns):
+                self.refresh(directory)
+
+    def run(self):
+        while not self.stop_event.wait(self.check_interval):
+            self.check()
+            self.save()
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.save()
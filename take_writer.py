@@ -0,0 +1,211 @@
+import queue
+import threading
+import time
+
+from analysis import TrackAnalyzer, sidecar_path, summary, write_sidecar
+from dsp import INT16, deinterleave, to_float, track_bytes
+from raw_take import RawTake, raw_path, track_path
+from wavfile import TakeFile
+
+
+class TakeWriter:
+    # Streams interleaved capture buffers straight to one mono WAV per
+    # selected track. The capture thread only enqueues raw buffers; a writer
+    # thread de-interleaves them and appends to the open files, so memory use
+    # stays flat however long the take runs and stopping only has to drain
+    # what is still queued. Each track is a TakeFile, so its header is kept
+    # current while recording and long takes roll over to RF64. Given a
+    # thread pool, the tracks of each batch are written and finally closed
+    # concurrently. With `analyse`, every track also streams through a
+    # TrackAnalyzer on its way to disk and gets a .peaks sidecar on close.
+    # With `raw`, batches go unsplit to one interleaved _raw.wav instead, a
+    # single sequential write each, and split_tracks() splits the selected
+    # tracks out of its memory mapping once it is closed; the raw file stays
+    # so any other channel can be exported later.
+
+    def __init__(self, save_directory, custom_name, take_number, tracks, channels, sample_rate,
+                 sample_format=INT16, max_queued_buffers=256, batch_buffers=16, header_interval=2.0,
+                 pool=None, metrics=None, analyse=True, raw=False):
+        self.save_directory = save_directory
+        self.custom_name = custom_name
+        self.take_number = take_number
+        self.tracks = list(tracks)
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.sample_format = sample_format
+        self.sample_width = sample_format.width
+        self.batch_buffers = batch_buffers
+        self.header_interval = header_interval
+        self.pool = pool
+        self.metrics = metrics
+        self.analyse = analyse
+        self.raw = raw
+        self.raw_file = None
+        self.split_seconds = 0.0
+        self.analyzers = {}
+        self.analysis = {}  # Track -> summary, once closed
+        self.queue = queue.Queue(maxsize=max_queued_buffers)
+        self.writers = {}
+        self.thread = None
+        self.dropped_buffers = 0
+        self.frames_written = 0
+        self.track_bytes = {track: 0 for track in self.tracks}
+        self.track_seconds = {track: 0.0 for track in self.tracks}
+        self.error = None
+
+    def track_path(self, track):
+        return track_path(self.save_directory, self.custom_name, self.take_number, track)
+
+    def raw_path(self):
+        return raw_path(self.save_directory, self.custom_name, self.take_number)
+
+    def start(self):
+        if self.raw:
+            self.raw_file = TakeFile(self.raw_path(), self.channels, self.sample_rate, self.sample_width,
+                                     format_tag=self.sample_format.format_tag, header_interval=self.header_interval)
+        else:
+            for track in self.tracks:
+                self.writers[track] = TakeFile(self.track_path(track), 1, self.sample_rate, self.sample_width,
+                                               format_tag=self.sample_format.format_tag,
+                                               header_interval=self.header_interval)
+                if self.analyse:
+                    self.analyzers[track] = TrackAnalyzer(self.sample_rate, self.save_directory)
+        self.thread = threading.Thread(target=self.run, name="TakeWriter")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, data):
+        # Called from the record thread, which reads from the capture ring.
+        # A stalled disk blocks it here while the ring keeps filling; audio
+        # is only lost if the ring laps the reader, and that is counted there
+        # as an overrun.
+        if self.metrics is not None:
+            self.metrics.writer_queue_depth.record(self.queue.qsize())
+        self.queue.put(data)
+
+    def run(self):
+        finished = False
+        while not finished:
+            data = self.queue.get()
+            if data is None:
+                break
+            batch = [data]
+            # Drain whatever else is already waiting so files see fewer,
+            # larger writes.
+            while len(batch) < self.batch_buffers:
+                try:
+                    data = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if data is None:
+                    finished = True
+                    break
+                batch.append(data)
+            if self.error is None:
+                try:
+                    self.write_batch(b''.join(batch))
+                    continue
+                except Exception as e:
+                    self.error = e
+                    print(f"Writer error: {e}")
+            # Past a write error the rest of the take is discarded, and counted
+            self.dropped_buffers += len(batch)
+
+    def write_batch(self, data):
+        if self.raw_file is not None:
+            start = time.perf_counter()
+            self.raw_file.write(data)
+            if self.metrics is not None:
+                self.metrics.record_disk_write(len(data), time.perf_counter() - start)
+            self.frames_written += len(data) // (self.sample_width * self.channels)
+            return
+        # One contiguous batch, one strided view and one write per track
+        views = deinterleave(data, self.channels, self.tracks, self.sample_format)
+        if self.pool is None:
+            for item in views.items():
+                self.write_track(item)
+        else:
+            list(self.pool.map(self.write_track, views.items()))
+        self.frames_written += len(data) // (self.sample_width * self.channels)
+
+    def write_track(self, item):
+        track, view = item
+        start = time.perf_counter()
+        samples = track_bytes(view)
+        self.writers[track].write(samples)
+        elapsed = time.perf_counter() - start
+        self.track_seconds[track] += elapsed
+        self.track_bytes[track] += len(samples)
+        if self.metrics is not None:
+            self.metrics.record_disk_write(len(samples), elapsed)
+        analyzer = self.analyzers.get(track)
+        if analyzer is not None:
+            analyzer.process(to_float(view, self.sample_format))
+
+    def bytes_written(self):
+        if self.raw_file is not None:
+            return self.raw_file.data_size
+        return sum(self.track_bytes.values())
+
+    def track_throughput(self):
+        # MB/s per track over the time actually spent writing it
+        return {track: self.track_bytes[track] / seconds / (1024 * 1024) if seconds else 0.0
+                for track, seconds in self.track_seconds.items()}
+
+    def paths(self):
+        return [self.track_path(track) for track in self.tracks]
+
+    def split_tracks(self):
+        # Selected tracks out of the finished raw file through the mapping
+        start = time.perf_counter()
+        try:
+            with RawTake(self.raw_path()) as raw:
+                analysis = raw.export(self.tracks, {track: self.track_path(track) for track in self.tracks},
+                                      analyse=self.analyse and self.error is None, pool=self.pool,
+                                      header_interval=self.header_interval)
+        except Exception as e:
+            self.error = self.error or e
+            print(f"Split error: {e}")
+            return
+        self.split_seconds = time.perf_counter() - start
+        for track, figures in analysis.items():
+            self.track_bytes[track] = raw.frames * self.sample_width
+            self.track_seconds[track] = self.split_seconds
+            if figures is not None:
+                self.analysis[track] = figures
+
+    def finish_analysis(self, track):
+        # A failed sidecar leaves the take itself untouched
+        try:
+            result = self.analyzers[track].finish()
+            write_sidecar(sidecar_path(self.track_path(track)), result)
+            self.analysis[track] = summary(result)
+        except Exception as e:
+            print(f"Analysis error for track {track + 1}: {e}")
+
+    def close(self):
+        # Flush the queue and finalize every file header.
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.pool is None:
+            for wf in self.writers.values():
+                wf.close()
+        else:
+            list(self.pool.map(TakeFile.close, self.writers.values()))
+        self.writers = {}
+        if self.raw_file is not None:
+            self.raw_file.close()
+            self.raw_file = None
+        # A take cut short by a write error gets no analysis of what's left
+        analyzers = list(self.analyzers) if self.error is None else []
+        if self.pool is None:
+            for track in analyzers:
+                self.finish_analysis(track)
+        else:
+            list(self.pool.map(self.finish_analysis, analyzers))
+        self.analyzers = {}
+        if self.dropped_buffers:
+            print(f"Warning: writer dropped {self.dropped_buffers} buffers")
+
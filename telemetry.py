@@ -0,0 +1,175 @@
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+# Seconds between the NTP epoch (1900) and the Unix epoch
+NTP_OFFSET = 2208988800
+RMS_ADDRESS = "/recorder/rms"
+PEAK_ADDRESS = "/recorder/peak"
+TAKE_ADDRESS = "/recorder/take"
+
+
+def osc_string(text):
+    # OSC strings are NUL terminated and padded to a multiple of four bytes
+    data = text.encode('ascii') + b'\0'
+    return data + b'\0' * (-len(data) % 4)
+
+
+def parse_client(text):
+    # "host:port" -> (host, port)
+    host, _, port = text.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f"Telemetry client must be host:port, not {text!r}")
+    return host, int(port)
+
+
+class TelemetryPacket:
+    # One OSC bundle laid out once per channel count and then rewritten in
+    # place every tick:
+    #   /recorder/rms   f * channels  ballistic RMS level, 0-1 full scale
+    #   /recorder/peak  f * channels  held peak, 0-1 full scale
+    #   /recorder/take  i i f h       recording, take number, elapsed
+    #                                 seconds, bytes written
+    # The level arrays are big-endian NumPy views into the datagram itself,
+    # so filling them is one copy per array and nothing is allocated.
+
+    def __init__(self, channels):
+        self.channels = channels
+        meters = osc_string(',' + 'f' * channels)
+        rms = osc_string(RMS_ADDRESS) + meters + bytes(4 * channels)
+        peak = osc_string(PEAK_ADDRESS) + meters + bytes(4 * channels)
+        take = osc_string(TAKE_ADDRESS) + osc_string(',iifh') + bytes(20)
+        self.buffer = bytearray(osc_string('#bundle') + bytes(8))  # Time tag filled in per tick
+        offsets = []
+        for message in (rms, peak, take):
+            self.buffer += struct.pack('>i', len(message))
+            offsets.append(len(self.buffer))
+            self.buffer += message
+        rms_offset = offsets[0] + len(osc_string(RMS_ADDRESS)) + len(meters)
+        peak_offset = offsets[1] + len(osc_string(PEAK_ADDRESS)) + len(meters)
+        self.take_offset = len(self.buffer) - 20
+        self.rms = np.frombuffer(self.buffer, dtype='>f4', count=channels, offset=rms_offset)
+        self.peak = np.frombuffer(self.buffer, dtype='>f4', count=channels, offset=peak_offset)
+
+    def set_time(self, when):
+        seconds = when + NTP_OFFSET
+        struct.pack_into('>II', self.buffer, 8, int(seconds), int((seconds % 1) * 4294967296) & 0xFFFFFFFF)
+
+    def set_take(self, recording, take_number, elapsed, bytes_written):
+        struct.pack_into('>iifq', self.buffer, self.take_offset, int(recording), take_number, elapsed, bytes_written)
+
+
+class TelemetryPublisher:
+    # Sends meter levels and take progress to every subscribed client as one
+    # bundle per tick, `rate` times a second, from its own thread. It reads
+    # the meter's latest state rather than hearing about each buffer, so
+    # the capture and meter threads do no extra work however many clients
+    # listen, and a slow tick is skipped rather than made up in a burst.
+    # `meter_source` returns the current LevelMeter (or None) and
+    # `take_source` returns (recording, take number, elapsed, bytes written).
+
+    def __init__(self, meter_source, take_source, rate=20.0, clients=()):
+        self.meter_source = meter_source
+        self.take_source = take_source
+        self.rate = max(rate, 0.1)
+        self.clients = ()  # Replaced, never mutated, so the thread reads it without a lock
+        self.client_lock = threading.Lock()
+        self.packet = None
+        self.socket = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.ticks = 0
+        self.packets_sent = 0
+        self.send_errors = 0
+        self.skipped_ticks = 0
+        self.last_publish_us = 0.0
+        self.max_publish_us = 0.0
+        for client in clients:
+            self.add_client(client)
+
+    def add_client(self, client):
+        # Resolved once here rather than on every send
+        host, port = client
+        client = (socket.gethostbyname(host), port)
+        with self.client_lock:
+            if client not in self.clients:
+                self.clients = self.clients + (client,)
+
+    def remove_client(self, client):
+        host, port = client
+        client = (socket.gethostbyname(host), port)
+        with self.client_lock:
+            self.clients = tuple(c for c in self.clients if c != client)
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="Telemetry")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        interval = 1.0 / self.rate
+        next_tick = time.monotonic()
+        while not self.stop_event.wait(max(next_tick - time.monotonic(), 0.0)):
+            self.publish()
+            next_tick += interval
+            now = time.monotonic()
+            if next_tick < now:
+                missed = int((now - next_tick) / interval) + 1
+                self.skipped_ticks += missed
+                next_tick += missed * interval
+
+    def publish(self):
+        self.ticks += 1
+        clients = self.clients
+        if not clients:
+            return
+        start = time.perf_counter()
+        meter = self.meter_source()
+        channels = meter.channels if meter is not None else 0
+        packet = self.packet
+        if packet is None or packet.channels != channels:
+            packet = self.packet = TelemetryPacket(channels)
+        if meter is not None:
+            with meter.lock:
+                packet.rms[:] = meter.state.level
+                packet.peak[:] = meter.state.peak_hold
+        packet.set_take(*self.take_source())
+        packet.set_time(time.time())
+        for client in clients:
+            try:
+                self.socket.sendto(packet.buffer, client)
+                self.packets_sent += 1
+            except OSError:
+                self.send_errors += 1
+        elapsed = (time.perf_counter() - start) * 1e6
+        self.last_publish_us = elapsed
+        if elapsed > self.max_publish_us:
+            self.max_publish_us = elapsed
+
+    def snapshot(self):
+        return {
+            'clients': len(self.clients),
+            'rate_hz': self.rate,
+            'ticks': self.ticks,
+            'skipped_ticks': self.skipped_ticks,
+            'packets_sent': self.packets_sent,
+            'send_errors': self.send_errors,
+            'last_publish_us': self.last_publish_us,
+            'max_publish_us': self.max_publish_us,
+        }
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
@@ -0,0 +1,79 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dsp import SAMPLE_FORMATS, as_frames, deinterleave, pack, to_float, track_bytes, unpack  # noqa: E402
+
+INT24 = SAMPLE_FORMATS['int24']
+# Full scale both ways, the values either side of zero and of each byte
+# boundary, and whatever a seeded generator adds
+EDGES = [-8388608, -8388607, -65536, -65535, -256, -255, -1, 0, 1, 255, 256, 65535, 65536, 8388606, 8388607]
+
+
+def int24_values(count=0, channels=None):
+    rng = np.random.default_rng(24)
+    values = np.concatenate((EDGES, rng.integers(-8388608, 8388608, size=count))).astype(np.int32)
+    if channels is not None:
+        values = values[:len(values) - len(values) % channels].reshape(-1, channels)
+    return values
+
+
+def test_int24_round_trip():
+    values = int24_values(1000)
+    data = pack(values, INT24).tobytes()
+    assert len(data) == 3 * len(values)
+    assert np.array_equal(unpack(as_frames(data, 1, INT24), INT24)[:, 0], values)
+
+
+def test_int24_matches_reference_decode():
+    values = int24_values(1000)
+    data = np.frombuffer(pack(values, INT24).tobytes(), dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+    reference = data[:, 0] | (data[:, 1] << 8) | (data[:, 2] << 16)
+    reference[reference >= 1 << 23] -= 1 << 24
+    assert np.array_equal(reference, values)
+
+
+def test_int24_interleaved_round_trip():
+    values = int24_values(999, channels=5)
+    data = pack(values, INT24).tobytes()
+    frames = as_frames(data, 5, INT24)
+    assert frames.shape == (len(values), 5, 3)
+    assert np.array_equal(unpack(frames, INT24), values)
+
+
+def test_int24_deinterleaved_columns():
+    values = int24_values(999, channels=6)
+    data = pack(values, INT24).tobytes()
+    views = deinterleave(data, 6, [0, 3, 5], INT24)
+    for track, view in views.items():
+        assert not view.flags['C_CONTIGUOUS']
+        assert np.array_equal(unpack(view, INT24), values[:, track])
+        # The bytes written for a track decode to that track alone
+        assert np.array_equal(unpack(as_frames(track_bytes(view), 1, INT24), INT24)[:, 0], values[:, track])
+
+
+def test_int24_full_scale_to_float():
+    samples = to_float(as_frames(pack(np.array([-8388608, 0, 8388607]), INT24).tobytes(), 1, INT24), INT24)
+    assert samples[0, 0] == -1.0
+    assert samples[1, 0] == 0.0
+    assert samples[2, 0] == np.float32(8388607 / 8388608)
+
+
+def test_pack_rounds_and_clips():
+    samples = np.array([-1e9, -8388608.4, -1.5, -0.4, 0.6, 8388606.6, 1e9])
+    expected = [-8388608, -8388608, -2, 0, 1, 8388607, 8388607]
+    assert np.array_equal(unpack(pack(samples, INT24), INT24), expected)
+    int16 = SAMPLE_FORMATS['int16']
+    assert np.array_equal(pack(np.array([-40000.0, -0.6, 32767.4, 40000.0]), int16), [-32768, -1, 32767, 32767])
+
+
+def test_int16_and_float32_pass_through():
+    for name, values in (('int16', np.array([[-32768, 32767], [-1, 0]], dtype='<i2')),
+                         ('float32', np.array([[-1.0, 1.0], [0.25, -0.5]], dtype='<f4'))):
+        fmt = SAMPLE_FORMATS[name]
+        frames = as_frames(pack(values, fmt).tobytes(), 2, fmt)
+        assert np.array_equal(unpack(frames, fmt), values)
+        assert np.array_equal(unpack(deinterleave(frames.tobytes(), 2, [1], fmt)[1], fmt), values[:, 1])
@@ -0,0 +1,140 @@
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wavfile  # noqa: E402
+from wavfile import DATA_OFFSET, HEADER_SIZE, RIFF_LIMIT, TakeFile, read_layout, recover_file  # noqa: E402
+
+FRAMES = 100
+
+
+def wav_with_trailing_list(path):
+    # A plain 16-bit mono WAV with a LIST/INFO chunk after the audio, as
+    # editors and field recorders write them
+    data = bytes(range(256)) * (FRAMES * 2 // 256) + bytes(FRAMES * 2 % 256)
+    info = b'INFO' + b'ISFT' + struct.pack('<I', 6) + b'tests\0'
+    chunks = (struct.pack('<4sIHHIIHH', b'fmt ', 16, 1, 1, 48000, 96000, 2, 16)
+              + struct.pack('<4sI', b'data', len(data)) + data
+              + struct.pack('<4sI', b'LIST', len(info)) + info)
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<4sI4s', b'RIFF', 4 + len(chunks), b'WAVE') + chunks)
+
+
+def data_frames(path):
+    with open(path, 'rb') as f:
+        layout = read_layout(f)
+    data_size = layout['data_size']
+    if layout['form'] == b'RF64' and data_size == RIFF_LIMIT:
+        data_size = layout['ds64_data_size']
+    return data_size // layout['block_align']
+
+
+def rf64_take(path, blocks, block_bytes=600, **options):
+    # A mono 16-bit take written `blocks` times; with the RF64 threshold
+    # lowered to a kilobyte, the second block promotes it
+    take_file = TakeFile(path, 1, 48000, 2, sync=False, **options)
+    for i in range(blocks):
+        take_file.write(bytes([i + 1]) * block_bytes)
+    return take_file
+
+
+def test_trailing_chunks_left_alone(tmp_path):
+    path = str(tmp_path / 'list.wav')
+    wav_with_trailing_list(path)
+    with open(path, 'rb') as f:
+        before = f.read()
+    assert recover_file(path) is None
+    with open(path, 'rb') as f:
+        assert f.read() == before
+    assert data_frames(path) == FRAMES
+
+
+def test_trailing_chunks_with_stale_riff_size_left_alone(tmp_path):
+    path = str(tmp_path / 'list.wav')
+    wav_with_trailing_list(path)
+    with open(path, 'r+b') as f:
+        f.seek(4)
+        f.write(struct.pack('<I', 1234))
+    assert recover_file(path) is None
+    assert data_frames(path) == FRAMES
+
+
+def test_interrupted_take_recovered(tmp_path):
+    path = str(tmp_path / 'take.wav')
+    take_file = TakeFile(path, 2, 48000, 3, header_interval=3600, sync=False)
+    take_file.write(bytes(6 * FRAMES))
+    take_file.refresh_header()
+    take_file.write(bytes(6 * FRAMES + 4))  # Cut short mid-frame, header not refreshed
+    take_file.file.close()
+    assert data_frames(path) == FRAMES
+    assert recover_file(path) == 2 * FRAMES
+    assert data_frames(path) == 2 * FRAMES
+    assert recover_file(path) is None
+
+
+def test_closed_take_left_alone(tmp_path):
+    path = str(tmp_path / 'take.wav')
+    take_file = TakeFile(path, 1, 48000, 3, sync=False)
+    take_file.write(bytes(3 * FRAMES))
+    take_file.close()
+    assert recover_file(path) is None
+    assert data_frames(path) == FRAMES
+
+
+def test_promoted_to_rf64_in_place(tmp_path, monkeypatch):
+    monkeypatch.setattr(wavfile, 'RF64_THRESHOLD', 1000)
+    path = str(tmp_path / 'take.wav')
+    take_file = rf64_take(path, 1)
+    take_file.refresh_header()
+    with open(path, 'rb') as f:
+        assert f.read(4) == b'RIFF'
+    take_file.write(bytes([2]) * 600)
+    take_file.close()
+
+    with open(path, 'rb') as f:
+        contents = f.read()
+        f.seek(0)
+        layout = read_layout(f)
+    assert layout['form'] == b'RF64'
+    assert contents[4:8] == struct.pack('<I', RIFF_LIMIT)
+    assert contents[DATA_OFFSET + 4:HEADER_SIZE] == struct.pack('<I', RIFF_LIMIT)
+    assert layout['ds64_riff_size'] == len(contents) - 8
+    assert layout['ds64_data_size'] == 1200
+    assert layout['data'] == HEADER_SIZE  # The JUNK chunk became ds64; the audio didn't move
+    assert contents[HEADER_SIZE:] == bytes([1]) * 600 + bytes([2]) * 600
+    assert recover_file(path) is None
+
+
+def test_interrupted_rf64_take_recovered(tmp_path, monkeypatch):
+    monkeypatch.setattr(wavfile, 'RF64_THRESHOLD', 1000)
+    path = str(tmp_path / 'take.wav')
+    take_file = rf64_take(path, 2, header_interval=3600)
+    take_file.refresh_header()
+    take_file.write(bytes(600))  # Never reaches the header
+    take_file.file.close()
+    assert data_frames(path) == 600
+    assert recover_file(path) == 900
+    with open(path, 'rb') as f:
+        layout = read_layout(f)
+    assert layout['ds64_riff_size'] == os.path.getsize(path) - 8
+    assert data_frames(path) == 900
+    assert recover_file(path) is None
+
+
+def test_riff_take_past_threshold_recovered_as_rf64(tmp_path, monkeypatch):
+    monkeypatch.setattr(wavfile, 'RF64_THRESHOLD', 1000)
+    path = str(tmp_path / 'take.wav')
+    take_file = rf64_take(path, 1, header_interval=3600)
+    take_file.refresh_header()
+    take_file.write(bytes(600))  # Past the threshold, but the header is still plain RIFF
+    take_file.file.close()
+    with open(path, 'rb') as f:
+        assert f.read(4) == b'RIFF'
+    assert recover_file(path) == 600
+    with open(path, 'rb') as f:
+        layout = read_layout(f)
+    assert layout['form'] == b'RF64'
+    assert layout['data'] == HEADER_SIZE
+    assert data_frames(path) == 600
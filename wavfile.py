@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+
+# Plain RIFF sizes are 32-bit; RF64 files carry this in the 32-bit size
+# fields and their real sizes in the ds64 chunk
+RIFF_LIMIT = 0xFFFFFFFF
+# RIFF size past which a file is rewritten as RF64
+RF64_THRESHOLD = RIFF_LIMIT
+
+# Fixed header layout written by TakeFile. The JUNK chunk reserves room for
+# the RF64 ds64 chunk so a file can be promoted in place.
+DS64_SIZE = 28
+FMT_SIZE = 16
+DS64_OFFSET = 12
+FMT_OFFSET = DS64_OFFSET + 8 + DS64_SIZE
+DATA_OFFSET = FMT_OFFSET + 8 + FMT_SIZE
+HEADER_SIZE = DATA_OFFSET + 8
+
+
+class TakeFile:
+    # A WAV file that is appended to while recording and whose header is
+    # refreshed every `header_interval` seconds, so a file left behind by a
+    # crash or power cut is playable up to the last refresh (and fully
+    # repairable with recover_file). Takes that outgrow 4 GB are switched to
+    # RF64 automatically.
+
+    def __init__(self, path, channels, sample_rate, sample_width, format_tag=WAVE_FORMAT_PCM,
+                 header_interval=2.0, sync=True):
+        self.path = path
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.format_tag = format_tag
+        self.header_interval = header_interval
+        self.sync = sync
+        self.block_align = channels * sample_width
+        self.data_size = 0
+        self.rf64 = False
+        self.file = open(path, 'wb')
+        self.file.write(self.header())
+        self.next_refresh = time.monotonic() + header_interval
+
+    def header(self):
+        riff_size = HEADER_SIZE - 8 + self.data_size + (self.data_size & 1)
+        if self.rf64 or riff_size > RF64_THRESHOLD:
+            self.rf64 = True
+            frames = self.data_size // self.block_align
+            riff = struct.pack('<4sI4s', b'RF64', RIFF_LIMIT, b'WAVE')
+            reserved = struct.pack('<4sIQQQI', b'ds64', DS64_SIZE, riff_size, self.data_size, frames, 0)
+            data = struct.pack('<4sI', b'data', RIFF_LIMIT)
+        else:
+            riff = struct.pack('<4sI4s', b'RIFF', riff_size, b'WAVE')
+            reserved = struct.pack('<4sI', b'JUNK', DS64_SIZE) + bytes(DS64_SIZE)
+            data = struct.pack('<4sI', b'data', self.data_size)
+        fmt = struct.pack('<4sIHHIIHH', b'fmt ', FMT_SIZE, self.format_tag, self.channels,
+                          self.sample_rate, self.sample_rate * self.block_align,
+                          self.block_align, self.sample_width * 8)
+        return riff + reserved + fmt + data
+
+    def write(self, data):
+        self.file.write(data)
+        self.data_size += len(data)
+        if time.monotonic() >= self.next_refresh:
+            self.refresh_header()
+
+    def refresh_header(self):
+        self.file.seek(0)
+        self.file.write(self.header())
+        self.file.seek(0, os.SEEK_END)
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+        self.next_refresh = time.monotonic() + self.header_interval
+
+    def close(self):
+        if self.file is None:
+            return
+        if self.data_size & 1:
+            self.file.write(b'\x00')  # RIFF chunks are word aligned
+        self.refresh_header()
+        self.file.close()
+        self.file = None
+
+
+def read_layout(f):
+    # Locate the ds64, fmt and data chunks of a RIFF/RF64 WAVE file.
+    # Returns None for anything that isn't one.
+    head = f.read(12)
+    if len(head) < 12 or head[:4] not in (b'RIFF', b'RF64') or head[8:12] != b'WAVE':
+        return None
+    layout = {'form': head[:4], 'riff_size': struct.unpack('<I', head[4:8])[0], 'ds64': None,
+              'ds64_riff_size': None, 'ds64_data_size': None, 'format_tag': None, 'channels': None,
+              'sample_rate': None, 'block_align': None, 'bits': None, 'data': None, 'data_size': None}
+    pos = 12
+    while True:
+        f.seek(pos)
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return layout
+        chunk_id, size = struct.unpack('<4sI', chunk)
+        if chunk_id == b'ds64':
+            layout['ds64'] = pos + 8
+            sizes = f.read(16)
+            if len(sizes) == 16:
+                layout['ds64_riff_size'], layout['ds64_data_size'] = struct.unpack('<QQ', sizes)
+        elif chunk_id == b'fmt ':
+            fmt = f.read(FMT_SIZE)
+            if len(fmt) == FMT_SIZE:
+                (layout['format_tag'], layout['channels'], layout['sample_rate'], _,
+                 layout['block_align'], layout['bits']) = struct.unpack('<HHIIHH', fmt)
+        elif chunk_id == b'data':
+            layout['data'] = pos + 8
+            layout['data_size'] = size
+            return layout
+        pos += 8 + size + (size & 1)
+
+
+def layout_data_size(layout):
+    # Declared size of the data chunk; RF64 files keep it in the ds64 chunk
+    data_size = layout['data_size']
+    if data_size == RIFF_LIMIT and layout['ds64_data_size'] is not None:
+        data_size = layout['ds64_data_size']
+    return data_size
+
+
+def layout_format(layout, formats):
+    # The entry of `formats` (anything with format_tag and width, such as
+    # dsp.SAMPLE_FORMATS.values()) matching the layout, or None
+    return next((fmt for fmt in formats
+                 if fmt.format_tag == layout['format_tag'] and fmt.width * 8 == layout['bits']), None)
+
+
+def chunks_to_end(f, pos, file_size):
+    # True if well-formed chunks run from `pos` to the end of the file, as
+    # with LIST/bext/iXML chunks written after the audio
+    while pos < file_size:
+        f.seek(pos)
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return False
+        chunk_id, size = struct.unpack('<4sI', chunk)
+        if not all(32 <= c < 127 for c in chunk_id):
+            return False
+        pos += 8 + size + (size & 1)
+    # The last pad byte is often left off
+    return pos <= file_size + 1
+
+
+def is_stale(f, layout, file_size):
+    # A header is stale when the RIFF size doesn't cover the file, unless the
+    # declared data chunk ends inside it and valid chunks follow it (then the
+    # file is somebody else's and not a take cut short)
+    riff_size = layout['riff_size']
+    if layout['form'] == b'RF64' and layout['ds64_riff_size'] is not None:
+        riff_size = layout['ds64_riff_size']
+    data_size = layout_data_size(layout)
+    if riff_size + 8 in (file_size, file_size + 1):
+        return False
+    data_end = layout['data'] + data_size + (data_size & 1)
+    return data_end >= file_size or not chunks_to_end(f, data_end, file_size)
+
+
+def recover_file(path):
+    # Rewrite the size fields of a WAV/RF64 file whose data chunk runs to the
+    # end of the file but whose header is stale. Returns the recovered frame
+    # count, or None if the file was already consistent or isn't repairable.
+    with open(path, 'r+b') as f:
+        layout = read_layout(f)
+        if layout is None or layout['data'] is None or not layout['block_align']:
+            return None
+        file_size = f.seek(0, os.SEEK_END)
+        if not is_stale(f, layout, file_size):
+            return None
+        data_offset = layout['data']
+        data_size = file_size - data_offset
+        data_size -= data_size % layout['block_align']
+        riff_size = data_offset - 8 + data_size + (data_size & 1)
+        frames = data_size // layout['block_align']
+
+        if riff_size > RF64_THRESHOLD or layout['form'] == b'RF64':
+            # Needs the 64-bit sizes; only possible with a ds64 chunk or the
+            # JUNK placeholder that TakeFile reserves for it.
+            ds64 = layout['ds64']
+            if ds64 is None:
+                f.seek(DS64_OFFSET)
+                if f.read(8) != struct.pack('<4sI', b'JUNK', DS64_SIZE):
+                    print(f"Cannot recover {path}: over 4 GB without room for RF64 sizes")
+                    return None
+                ds64 = DS64_OFFSET + 8
+            f.seek(ds64 - 8)
+            current = f.read(8 + 16)
+            expected = struct.pack('<4sIQQ', b'ds64', DS64_SIZE, riff_size, data_size)
+            if layout['form'] == b'RF64' and current == expected:
+                return None
+            f.seek(0)
+            f.write(struct.pack('<4sI', b'RF64', RIFF_LIMIT))
+            f.seek(ds64 - 8)
+            f.write(struct.pack('<4sIQQQ', b'ds64', DS64_SIZE, riff_size, data_size, frames))
+            f.seek(data_offset - 4)
+            f.write(struct.pack('<I', RIFF_LIMIT))
+            return frames
+
+        f.seek(4)
+        current_riff = struct.unpack('<I', f.read(4))[0]
+        f.seek(data_offset - 4)
+        current_data = struct.unpack('<I', f.read(4))[0]
+        if current_riff == riff_size and current_data == data_size:
+            return None
+        f.seek(4)
+        f.write(struct.pack('<I', riff_size))
+        f.seek(data_offset - 4)
+        f.write(struct.pack('<I', data_size))
+        return frames
+
+
+def recover_directory(directory):
+    # Repair every WAV in `directory` left with a stale header.
+    # Returns {filename: recovered frame count} for the files that changed.
+    repaired = {}
+    for entry in os.scandir(directory):
+        if not entry.is_file() or not entry.name.lower().endswith('.wav'):
+            continue
+        try:
+            frames = recover_file(entry.path)
+        except OSError as e:
+            print(f"Cannot recover {entry.name}: {e}")
+            continue
+        if frames is not None:
+            repaired[entry.name] = frames
+    return repaired
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Repair the headers of take files left by an interrupted recording.")
+    parser.add_argument('directory', nargs='?', help="Directory to scan (defaults to save_directory in config.json)")
+    parser.add_argument('--config', default='config.json')
+    args = parser.parse_args()
+
+    directory = args.directory
+    if directory is None and os.path.exists(args.config):
+        with open(args.config, 'r') as f:
+            directory = json.load(f).get('save_directory')
+    if not directory or not os.path.isdir(directory):
+        parser.error("no valid directory to scan")
+
+    repaired = recover_directory(directory)
+    for name, frames in sorted(repaired.items()):
+        print(f"Recovered {name}: {frames} frames")
+    print(f"{len(repaired)} file(s) repaired in {directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())